@@ -27,7 +27,7 @@ def evaluate_running():
     with tf.Graph().as_default():
 
         # reading test data
-        images, labels = cifar10_input.read_cifar10(data_path=test_data_path,
+        images, labels = cifar10_input.read_cifar10_in_memory(data_path=test_data_path,
                                                     is_train=False,
                                                     batch_size= batch_size,
                                                     shuffle=False)
@@ -6,6 +6,7 @@ Created on Tue Apr  3 16:15:27 2018
 @author: zhong
 """
 
+import sys
 import os
 import os.path
 import numpy as np
@@ -14,6 +15,8 @@ import math
 
 import cifar10_input
 import tools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import train_loop
 
 from models.lenet5 import LeNet5
 from models.alexnet import AlexNet
@@ -36,17 +39,15 @@ def evaluate(sess, val_image, val_label):
     
     val_num = 10000
     val_num_iter = int(math.ceil(val_num / batch_size))
-    total_loss = 0.0
-    total_acc = 0.0
+    # the mean over the val batches is kept in-graph, the update returns the running mean
+    sess.run(val_reset)
 
     for _ in np.arange(val_num_iter):
         val_images, val_labels = sess.run([val_image, val_label])
-        val_loss, val_acc = sess.run([loss, acc],
+        val_acc, val_loss = sess.run(val_update,
                                      feed_dict={xs: val_images, ys: val_labels, keep_prob: 1.0})
-        total_loss += val_loss
-        total_acc += val_acc
 
-    return total_loss/val_num_iter, total_acc/val_num_iter
+    return val_loss, val_acc
 
 
 def train_running():
@@ -66,15 +67,13 @@ def train_running():
                 if coord.should_stop():
                         break
                 
-                tra_images, tra_labels = sess.run([train_batch, train_label_batch])
-                _, tra_loss, tra_acc = sess.run([train_op, loss, acc],
-                                                feed_dict={xs: tra_images, ys: tra_labels, keep_prob: dropout_rate})
-                   
                 if step % 50 == 0:                 
+                    _, tra_loss, tra_acc, summary_str = sess.run([train_op, loss, acc, summary_op],
+                                                                 feed_dict={keep_prob: dropout_rate})
                     print ('Step %d, train loss = %.4f, train accuracy = %.2f%%' % (step, tra_loss, tra_acc*100.0))
-                    summary_str = sess.run(summary_op, 
-                                           feed_dict={xs: tra_images, ys: tra_labels, keep_prob: dropout_rate})
                     summary_writer.add_summary(summary_str, step)
+                else:
+                    sess.run(train_op, feed_dict={keep_prob: dropout_rate})
 
                 if step % 200 == 0 or (step + 1) == max_step:
                     val_loss, val_acc = evaluate(sess, val_batch, val_label_batch)
@@ -96,17 +95,18 @@ if __name__ == '__main__':
     with tf.Graph().as_default():
 
         with tf.device('/cpu:0'):
-            train_batch, train_label_batch = cifar10_input.read_cifar10(data_path=data_path,
+            train_batch, train_label_batch = cifar10_input.read_cifar10_in_memory(data_path=data_path,
                                                                         is_train=True,
                                                                         batch_size= batch_size,
                                                                         shuffle=True)
-            val_batch, val_label_batch = cifar10_input.read_cifar10(data_path=data_path,
+            val_batch, val_label_batch = cifar10_input.read_cifar10_in_memory(data_path=data_path,
                                                                     is_train=False,
                                                                     batch_size= batch_size,
                                                                     shuffle=False)
         
-        xs = tf.placeholder(tf.float32, shape=[batch_size, img_h, img_w, 3])
-        ys = tf.placeholder(tf.int32, shape=[batch_size, num_classes])
+        # the train batch goes straight into the model, val batches are fed
+        xs = tf.placeholder_with_default(train_batch, shape=[batch_size, img_h, img_w, 3])
+        ys = tf.placeholder_with_default(tf.cast(train_label_batch, tf.int32), shape=[batch_size, num_classes])
         keep_prob = tf.placeholder(tf.float32)
         
         model = VGG16(xs, num_classes, keep_prob)
@@ -115,4 +115,6 @@ if __name__ == '__main__':
         loss = tools.losses(logits, ys)
         acc = tools.accuracy(logits, ys)
         train_op = tools.optimizer(loss, learning_rate)
+        # sorted by name: [accuracy, loss]
+        val_update, _, val_reset = train_loop.average_metrics({'loss': loss, 'accuracy': acc}, name='val_average')
         train_running()
\ No newline at end of file
@@ -14,7 +14,8 @@ class myConfig(object):
 
     # 模型参数
     num_classes = 6        # 类别数
-#    timestep_size = 1   # 时序持续长度为120，即每做一次预测，需要输入120行
+    timestep_size = 8       # 每个片段的帧数 T, 1 为单帧输入 [batch, w, h, 1]
+    clip_stride = 2         # 片段中相邻两帧的间隔
 #    input_size = 128      # 每个时刻的输入特征是80维的，就是每个时刻输入一行，一行有 80 个像素
     num_layers= 2           # 隐藏层层数
     hidden_dim = 256        # 隐藏层神经元
@@ -27,12 +28,23 @@ class myConfig(object):
 class myModel(object):
     """RNN模型"""
     
-    def __init__(self, config):
+    def __init__(self, config, input_x=None, input_y=None):
         
         self.config = config
-        # 待输入的数据
-        self.input_x = tf.placeholder(tf.float32, [128, self.config.img_w, self.config.img_h, 1], name='input_x')
-        self.input_y = tf.placeholder(tf.int32, [128], name='input_y')
+        # 待输入的数据, 给定输入管道的batch时直接接入计算图, 仍可以通过feed_dict输入
+        # timestep_size > 1 时输入为片段 [batch, T, w, h, 1]
+        if self.config.timestep_size > 1:
+            x_shape = [None, self.config.timestep_size, self.config.img_w, self.config.img_h, 1]
+        else:
+            x_shape = [None, self.config.img_w, self.config.img_h, 1]
+        if input_x is None:
+            self.input_x = tf.placeholder(tf.float32, x_shape, name='input_x')
+        else:
+            self.input_x = tf.placeholder_with_default(input_x, x_shape, name='input_x')
+        if input_y is None:
+            self.input_y = tf.placeholder(tf.int32, [None], name='input_y')
+        else:
+            self.input_y = tf.placeholder_with_default(tf.cast(input_y, tf.int32), [None], name='input_y')
         self.batch_size = tf.placeholder(tf.int32, [], name='batch_size') 
         self.keep_prob = tf.placeholder(tf.float32, [], name='keep_prob')
         self.is_pretrain = True
@@ -43,7 +55,9 @@ class myModel(object):
         
         """cnn模型"""
         with tf.name_scope('cnn'):
-            self.conv1 = tools.conv('conv1', self.input_x , 16, kernel_size=[3, 3], stride=[1, 1, 1, 1], is_pretrain=self.is_pretrain)
+            # 时间维并入batch, 所有帧一次通过CNN [batch*T, w, h, 1]
+            self.frames = tf.reshape(self.input_x, [-1, self.config.img_w, self.config.img_h, 1])
+            self.conv1 = tools.conv('conv1', self.frames, 16, kernel_size=[3, 3], stride=[1, 1, 1, 1], is_pretrain=self.is_pretrain)
             self.pool1 = tools.pool('pool1', self.conv1, kernel=[1, 3, 3, 1], stride=[1, 2, 2, 1], is_max_pool=True, is_norm=True)
 
             self.conv2 = tools.conv('conv2', self.pool1, 16, kernel_size=[3, 3], stride=[1, 1, 1, 1], is_pretrain=self.is_pretrain)
@@ -71,9 +85,10 @@ class myModel(object):
             return tf.contrib.rnn.DropoutWrapper(cell, output_keep_prob=self.keep_prob)
 
         with tf.name_scope("rnn"):
-            _batch, _fcsize = self.norm2.get_shape().as_list()
-            X = tf.reshape(self.norm2, [_batch, 1, _fcsize])
-            timestep_size = 1
+            _fcsize = self.norm2.get_shape().as_list()[-1]
+            # 再展开时间维 [batch, T, fc]
+            timestep_size = self.config.timestep_size
+            X = tf.reshape(self.norm2, [-1, timestep_size, _fcsize])
 #            input_size = _fcsize
             # 多层rnn网络
             cells = [dropout() for _ in range(self.config.num_layers)]
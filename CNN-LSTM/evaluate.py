@@ -19,6 +19,7 @@ BATCH_SIZE = 128
 data_dir = './data/KTH_RGB/'
 model_dir = './model/'
 val_txt = 'val.txt'
+val_video_txt = 'val_video.txt'
 
 def evaluate_running():
     with tf.Graph().as_default():
@@ -26,7 +27,12 @@ def evaluate_running():
         config = myConfig()
         model = myModel(config)
         
-        val_batch, val_label_batch, n_test = input_data.get_batch(val_txt, model.config.img_w, model.config.img_h, BATCH_SIZE, CAPACITY)
+        if model.config.timestep_size > 1:
+            val_batch, val_label_batch, n_test = input_data.get_clip_batch(val_video_txt, model.config.img_w, model.config.img_h,
+                                                                           model.config.timestep_size, BATCH_SIZE,
+                                                                           model.config.clip_stride, shuffle=False)
+        else:
+            val_batch, val_label_batch, n_test = input_data.get_batch(val_txt, model.config.img_w, model.config.img_h, BATCH_SIZE, CAPACITY)
         
         saver = tf.train.Saver(tf.global_variables())
         
@@ -7,10 +7,17 @@ Created on Thu Mar 29 08:03:17 2018
 """
 
 
+import sys
 import tensorflow as tf
 import numpy as np
 import os
-import math
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from augment import augment_batch
+import cv2
+import threading
+from collections import OrderedDict
+import pipeline_tuner
+from image_utils import jpeg_size, decode_ratio, batch_standardization, get_cached_batch
 
 
 def getPerActionList(actionPath):
@@ -73,7 +80,18 @@ def generate_txt(data_dir, ratio):
     print('Testing num: %d' % test_num)
 
 
-def get_batch(file, image_W, image_H, batch_size, capacity):
+def get_batch(file, image_W, image_H, batch_size, capacity, cache=None, augment=None):
+    '''
+    Args:
+        file: txt file written by generate_txt, 'image label' per line
+        cache: None, decode every image in every epoch with the queue runners
+               'memory', keep the decoded and resized uint8 images in RAM
+               a directory, keep them in a cache file there, for datasets
+               larger than RAM
+        augment: None, or a policy dict of augment.augment_batch, the random
+                 crop/flip/brightness/contrast is applied to the whole uint8
+                 batch after dequeue
+    '''
 
     img_label = []
     with open(file, 'r') as file_to_read:
@@ -87,6 +105,12 @@ def get_batch(file, image_W, image_H, batch_size, capacity):
         label = np.int32(label)
 
     num = len(img)
+    # decode at 1/ratio of the size straight in the DCT domain, the resize has less to do
+    ratio = decode_ratio(img[0], image_W, image_H)
+    if cache is not None:
+        image_batch, label_batch = get_cached_batch(img, label, image_W, image_H, batch_size, capacity, cache, augment=augment, ratio=ratio, channels=1)
+        return image_batch, label_batch, num
+
     image = tf.cast(img, tf.string)
     label = tf.cast(label, tf.int64)
 
@@ -95,26 +119,202 @@ def get_batch(file, image_W, image_H, batch_size, capacity):
     
     label = input_queue[1]
     image_contents = tf.read_file(input_queue[0])
-    image = tf.image.decode_jpeg(image_contents, channels=3)
+    image = tf.image.decode_jpeg(image_contents, channels=1, ratio=ratio)
     
     ######################################
-    # data argumentation should go to here
+    # data augmentation is done on the whole batch after dequeue, see augment
     ######################################
 
     # image = tf.image.resize_image_with_crop_or_pad(image, image_W, image_H)
     image = tf.image.resize_images(image, [image_W, image_H], method=0)
-    image = tf.image.per_image_standardization(image)
-    
-    image = tf.image.rgb_to_grayscale(image)
+    # keep uint8 in the queue, the whole batch is standardized after dequeue
+    image = tf.saturate_cast(tf.round(image), tf.uint8)
 
-    image_batch, label_batch = tf.train.batch([image, label],
-                                              batch_size=batch_size,
-                                              num_threads=64,
-                                              capacity=capacity)
+    image_batch, label_batch = pipeline_tuner.batch([image, label], batch_size, capacity)
     
     label_batch = tf.reshape(label_batch, [batch_size])
 #    label_batch = tf.one_hot(label_batch, 6)
-    image_batch = tf.cast(image_batch, tf.float32)
+    if augment is not None:
+        image_batch = augment_batch(image_batch, augment)
+    image_batch = batch_standardization(image_batch)
     
     return image_batch, label_batch, num
 
+
+#%% Clips of consecutive frames
+
+def getVideoList(actionPath, actionNum):
+    '''(video directory, label) of every video, the labels are the indices of actionNum'''
+    video_label_list = []
+    for class_num, i in enumerate(actionNum):
+        for video in sorted(os.listdir(actionPath + i)):
+            videoName = os.path.join(actionPath + i, video)
+            if os.path.isdir(videoName):
+                video_label_list.append(videoName + ' ' + str(class_num))
+    np.random.shuffle(video_label_list)
+    return video_label_list
+
+
+def generate_video_txt(data_dir, ratio):
+    '''split the videos (not the frames) into train_video.txt and val_video.txt,
+    so no clip of a val video is seen in training'''
+
+    trainFile = './train_video.txt'
+    testFile = './val_video.txt'
+
+    ACTIONNUM = sorted(os.listdir(data_dir))
+
+    video_label = getVideoList(data_dir, ACTIONNUM)
+
+    train_video_label = video_label[:int(len(video_label) * ratio)]
+    test_video_label = video_label[int(len(video_label) * ratio):]
+    train_num = get_txt(trainFile, train_video_label)
+    test_num = get_txt(testFile, test_video_label)
+
+    print('Successfully generated video txt file')
+    print('Trainging videos: %d' % train_num)
+    print('Testing videos: %d' % test_num)
+
+
+class ClipSampler(object):
+    '''clips of clip_length frames, stride frames apart, from the videos of a video txt
+
+    The videos are walked num_active at a time, one clip of each in turn, and
+    the clips of a video start step frames apart. Overlapping clips of a video
+    are therefore close in time, and a frame decoded for one clip is served
+    from a small LRU cache for the next ones, the decode cost stays about one
+    decode per frame instead of clip_length. The clips come out in that order,
+    get_clip_batch decodes them in parallel and shuffles them in a buffer.
+    '''
+
+    def __init__(self, file, image_W, image_H, clip_length, stride=1, step=None,
+                 num_active=16, cache_size=None, shuffle=True, seed=None):
+        '''
+        Args:
+            file: txt file written by generate_video_txt, 'video label' per line
+            image_W: image width
+            image_H: image height
+            clip_length: number of frames per clip, T
+            stride: distance of two frames of a clip
+            step: distance of the first frames of two clips of a video,
+                  default half a clip
+            num_active: number of videos clips are taken from in turn
+            cache_size: number of decoded frames kept, default 2 * num_active * clip_length
+            shuffle: shuffle the videos every epoch
+            seed: seed of the shuffle
+        '''
+        self.videos = []
+        self.labels = []
+        with open(file, 'r') as file_to_read:
+            for line in file_to_read.readlines():
+                tmp = line.strip('\n').split(' ')
+                self.videos.append(sorted(os.path.join(tmp[0], frame) for frame in os.listdir(tmp[0])))
+                self.labels.append(int(tmp[-1]))
+        self.image_W = image_W
+        self.image_H = image_H
+        self.clip_length = clip_length
+        self.stride = stride
+        self.step = step or max(clip_length * stride // 2, 1)
+        self.num_active = num_active
+        self.cache_size = cache_size or 2 * num_active * clip_length
+        self.shuffle = shuffle
+        self.rng = np.random.RandomState(seed)
+        self.cache = OrderedDict()
+        # the clips are decoded by several threads of the dataset map
+        self.lock = threading.Lock()
+
+    def starts(self, video):
+        '''first frames of the clips of a video'''
+        span = (self.clip_length - 1) * self.stride + 1
+        return range(0, len(self.videos[video]) - span + 1, self.step)
+
+    def __len__(self):
+        '''number of clips per epoch'''
+        return sum(len(self.starts(i)) for i in range(len(self.videos)))
+
+    def frame(self, path):
+        '''decoded and resized uint8 grayscale frame [image_W, image_H, 1], through the LRU cache'''
+        with self.lock:
+            image = self.cache.pop(path, None)
+            if image is not None:
+                self.cache[path] = image
+                return image
+        # cv2 releases the GIL while decoding, the threads decode in parallel
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise IOError('Could not read: %s' % path)
+        image = cv2.resize(image, (self.image_H, self.image_W), interpolation=cv2.INTER_LINEAR)[:, :, np.newaxis]
+        with self.lock:
+            self.cache[path] = image
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return image
+
+    def clip(self, paths):
+        '''decoded clip [clip_length, image_W, image_H, 1] uint8 from the frame paths given by clip_paths'''
+        return np.stack([self.frame(path.decode() if isinstance(path, bytes) else path) for path in paths])
+
+    def clip_paths(self):
+        '''endless generator of (frame paths [clip_length], label) in the cache friendly order'''
+        while True:
+            order = self.rng.permutation(len(self.videos)) if self.shuffle else np.arange(len(self.videos))
+            pending = [(v, iter(self.starts(v))) for v in order]
+            active = []
+            while pending or active:
+                while pending and len(active) < self.num_active:
+                    active.append(pending.pop(0))
+                for v, starts in list(active):
+                    start = next(starts, None)
+                    if start is None:
+                        active.remove((v, starts))
+                        continue
+                    frames = self.videos[v][start:start + (self.clip_length - 1) * self.stride + 1:self.stride]
+                    yield np.array(frames), self.labels[v]
+
+    def clips(self):
+        '''endless generator of (clip [clip_length, image_W, image_H, 1] uint8, label), decoded in one thread'''
+        for paths, label in self.clip_paths():
+            yield self.clip(paths), label
+
+
+def get_clip_batch(file, image_W, image_H, clip_length, batch_size, stride=1, shuffle=True,
+                   shuffle_buffer=None, num_parallel_calls=8, **kwargs):
+    '''batches of clips for the CNN-LSTM
+    Args:
+        file: txt file written by generate_video_txt
+        clip_length: number of frames per clip, T
+        stride: distance of two frames of a clip
+        shuffle: shuffle the videos every epoch and the clips in a buffer
+        shuffle_buffer: number of decoded clips shuffled, default 16 * batch_size,
+                        the clips of the num_active videos mix across batches
+        num_parallel_calls: number of clips decoded at the same time
+        kwargs: passed to ClipSampler
+    Returns:
+        clip_batch: 5D tensor [batch_size, clip_length, width, height, 1], dtype=tf.float32
+        label_batch: 1D tensor [batch_size], dtype=tf.int32
+        number of clips per epoch
+    '''
+    sampler = ClipSampler(file, image_W, image_H, clip_length, stride, shuffle=shuffle, **kwargs)
+
+    def decode(paths, label):
+        clip = tf.py_func(sampler.clip, [paths], tf.uint8, stateful=False)
+        clip.set_shape([clip_length, image_W, image_H, 1])
+        return clip, label
+
+    dataset = tf.data.Dataset.from_generator(sampler.clip_paths,
+                                             (tf.string, tf.int32),
+                                             ([clip_length], []))
+    # map keeps the order, the cache still sees the clips of a video one after the other
+    dataset = dataset.map(decode, num_parallel_calls=num_parallel_calls)
+    if shuffle:
+        dataset = dataset.shuffle(shuffle_buffer or 16 * batch_size)
+    dataset = dataset.apply(tf.contrib.data.batch_and_drop_remainder(batch_size))
+    dataset = dataset.prefetch(2)
+    clip_batch, label_batch = dataset.make_one_shot_iterator().get_next()
+
+    # frames are standardized one by one, like in get_batch
+    frame_batch = tf.reshape(clip_batch, [batch_size * clip_length, image_W, image_H, 1])
+    frame_batch = batch_standardization(frame_batch)
+    clip_batch = tf.reshape(frame_batch, [batch_size, clip_length, image_W, image_H, 1])
+
+    return clip_batch, label_batch, len(sampler)
@@ -34,7 +34,7 @@ def draw_confusion_matrix(show_confusion_matrix=True):
         predictions_label = []
         true_label = []
 
-        val_batch, val_label_batch, n_test = input_data.get_batch(val_txt, IMG_W, IMG_H, BATCH_SIZE, CAPACITY)
+        val_batch, val_label_batch, n_test = input_data.get_batch(val_txt, IMG_W, IMG_H, BATCH_SIZE, CAPACITY, shuffle=False)
 
         x = tf.placeholder(tf.float32, shape=[BATCH_SIZE, IMG_W, IMG_H, 3])
         model = models.model(x, N_CLASSES)
@@ -32,7 +32,7 @@ def fc_feature_extract(txtfile, istrainFile=True):
   
     with tf.Graph().as_default():
 
-        batch, label_batch, n = input_data.get_batch(txtfile, IMG_W, IMG_H, BATCH_SIZE, CAPACITY)
+        batch, label_batch, n = input_data.get_batch(txtfile, IMG_W, IMG_H, BATCH_SIZE, CAPACITY, shuffle=False)
         
         x = tf.placeholder(tf.float32, shape=[BATCH_SIZE, IMG_W, IMG_H, 3])
         
@@ -108,7 +108,7 @@ def conv_feature_extract(txtfile):
   
     with tf.Graph().as_default():
 
-        batch, label_batch, n = input_data.get_batch(txtfile, IMG_W, IMG_H, BATCH_SIZE, CAPACITY)
+        batch, label_batch, n = input_data.get_batch(txtfile, IMG_W, IMG_H, BATCH_SIZE, CAPACITY, shuffle=False)
         
         x = tf.placeholder(tf.float32, shape=[BATCH_SIZE, IMG_W, IMG_H, 3])
         
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Memory-mapped uint8 dataset.
+
+build_memmap turns the images of a txt list (written by input_data.generate_txt)
+into one contiguous uint8 array 'prefix_images.npy' [N, width, height, 3] and a
+label array 'prefix_labels.npy'. MemmapDataset opens them with np.memmap, a
+sample is read in O(1) without opening or decoding any file, and from the
+second epoch on the OS page cache serves the whole dataset. get_memmap_batch
+gives the batches of a MemmapDataset as tensors, like input_data.get_batch.
+
+@author: zhong
+"""
+
+import os
+import sys
+import numpy as np
+import cv2
+import tensorflow as tf
+from multiprocessing import Pool, cpu_count
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from augment import augment_batch
+from image_utils import batch_standardization
+
+#%%
+def read_txt(file):
+    '''read a txt list written by generate_txt
+    Returns:
+        list of image directories, array of int32 labels
+    '''
+    img = []
+    label = []
+    with open(file, 'r') as file_to_read:
+        for line in file_to_read.readlines():
+            tmp = line.strip('\n').split(' ')
+            img.append(tmp[0])
+            label.append(int(tmp[-1]))
+    return img, np.array(label, dtype=np.int32)
+
+
+def _load_image(args):
+    '''read and resize one image to [image_W, image_H, 3] RGB uint8, like decode_jpeg + resize_images
+    '''
+    path, image_W, image_H = args
+    image = cv2.imread(path)
+    if image is None:
+        raise IOError('Could not read: %s' % path)
+    image = cv2.resize(image, (image_H, image_W), interpolation=cv2.INTER_LINEAR)
+    return image[:, :, ::-1]
+
+#%%
+def build_memmap(file, prefix, image_W, image_H, num_workers=None):
+    '''decode all images of a txt list once and write them into one uint8 .npy array
+    Args:
+        file: txt list, e.g. 'train.txt'
+        prefix: output prefix, writes prefix_images.npy and prefix_labels.npy
+        image_W: image width
+        image_H: image height
+        num_workers: number of decode processes, default is the number of cpu cores
+    Returns:
+        number of samples
+    '''
+    img, label = read_txt(file)
+    n = len(img)
+    images = np.lib.format.open_memmap(prefix + '_images.npy', mode='w+',
+                                       dtype=np.uint8, shape=(n, image_W, image_H, 3))
+    pool = Pool(processes=num_workers or cpu_count())
+    try:
+        jobs = [(path, image_W, image_H) for path in img]
+        # imap keeps the order of the list, so images[i] belongs to label[i]
+        for i, image in enumerate(pool.imap(_load_image, jobs, chunksize=64)):
+            images[i] = image
+    finally:
+        pool.close()
+        pool.join()
+    images.flush()
+    del images
+    np.save(prefix + '_labels.npy', label)
+    print('Write %d images to %s_images.npy' % (n, prefix))
+    return n
+
+#%%
+class MemmapDataset(object):
+    '''random access and batches over the arrays written by build_memmap
+    '''
+
+    def __init__(self, prefix):
+        self.images = np.load(prefix + '_images.npy', mmap_mode='r')
+        self.labels = np.load(prefix + '_labels.npy')
+        self.num = len(self.labels)
+
+    def __len__(self):
+        return self.num
+
+    def __getitem__(self, i):
+        return self.images[i], self.labels[i]
+
+    def batches(self, batch_size, shuffle=True, num_epochs=None, seed=None):
+        '''generate (image_batch, label_batch) of uint8 images and int32 labels
+        The two arrays are preallocated once and filled in place for every batch,
+        copy them if you need to keep a batch after asking for the next one.
+        The last incomplete batch of an epoch is dropped.
+        Args:
+            batch_size: batch size
+            shuffle: draw a new permutation every epoch
+            num_epochs: None for endless
+            seed: seed of the permutation
+        '''
+        rng = np.random.RandomState(seed)
+        image_batch = np.empty((batch_size,) + self.images.shape[1:], dtype=np.uint8)
+        label_batch = np.empty((batch_size,), dtype=np.int32)
+        epoch = 0
+        while num_epochs is None or epoch < num_epochs:
+            order = rng.permutation(self.num) if shuffle else np.arange(self.num)
+            for start in range(0, self.num - batch_size + 1, batch_size):
+                # sorted indices read the file front to back, the order inside a batch does not matter
+                index = np.sort(order[start:start + batch_size])
+                np.take(self.images, index, axis=0, out=image_batch)
+                np.take(self.labels, index, axis=0, out=label_batch)
+                yield image_batch, label_batch
+            epoch += 1
+
+#%%
+def get_memmap_batch(prefix, image_W, image_H, batch_size, capacity, txt=None, augment=None):
+    '''(image, label) batches of the arrays of build_memmap, a drop-in for input_data.get_batch
+    Args:
+        prefix: prefix of the arrays, they are built from txt if they do not exist
+        txt: txt list to build the arrays from, e.g. 'train.txt'
+        capacity: number of images prefetched
+        augment: None, or a policy dict of augment.augment_batch
+    Returns:
+        image_batch: 4D tensor [batch_size, width, height, 3], dtype=tf.float32
+        label_batch: 1D tensor [batch_size], dtype=tf.int32
+        n: number of samples
+    '''
+    if not os.path.exists(prefix + '_images.npy'):
+        build_memmap(txt, prefix, image_W, image_H)
+    data = MemmapDataset(prefix)
+    if data.images.shape[1:3] != (image_W, image_H):
+        raise ValueError('%s_images.npy holds %dx%d images, not %dx%d'
+                         % (prefix, data.images.shape[1], data.images.shape[2], image_W, image_H))
+
+    dataset = tf.data.Dataset.from_generator(lambda: data.batches(batch_size), (tf.uint8, tf.int32),
+                                             ([batch_size, image_W, image_H, 3], [batch_size]))
+    dataset = dataset.prefetch(max(capacity // batch_size, 1))
+
+    image_batch, label_batch = dataset.make_one_shot_iterator().get_next()
+    if augment is not None:
+        image_batch = augment_batch(image_batch, augment)
+    image_batch = batch_standardization(image_batch)
+
+    return image_batch, label_batch, len(data)
@@ -6,12 +6,17 @@ Created on Thu Mar 29 08:03:51 2018
 @author: zhong
 """
 
+import sys
 import os
-import numpy as np
 import tensorflow as tf
 import input_data
+import memmap_data
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import video_data
 import models
 import tools
+import train_loop
+import pipeline_tuner
 
 N_CLASSES = 6                                                      #### notice
 IMG_W = 80
@@ -19,17 +24,28 @@ IMG_H = 60
 RATIO = 0.3
 BATCH_SIZE = 128
 CAPACITY = 2000
+CACHE = None  # None, 'memory' or a directory: cache the decoded images after the first epoch
+AUGMENT = None  # None or a policy of augment.augment_batch, e.g. {'flip': True, 'brightness': 32}
+MEMMAP = None  # None, or the prefix of the uint8 arrays of memmap_data, e.g. './data/KTH_RGB_80x60', built on first use
+INPUT_THREADS = None  # decode threads shared by the train and val queues, None for half of the cores
 MAX_STEP = 6000
 LEARNING_RATE = 1e-3  # with current parameters, it is suggested to use learning rate<0.0001
 TRAIN_RATIO = 0.7
 data_dir = './data/KTH_RGB/'
+video_dir = None  # e.g. './data/KTH/', read the frames from the .avi files instead of data_dir
+FRAME_STEP = 5  # keep every FRAME_STEP-th frame of the videos
 model_dir = './model/KTH_RGB/'
 logs_train_dir = './logs/KTH_RGB_train/'
 logs_val_dir = './logs/KTH_RGB_val/'
 train_txt = 'train.txt'
 val_txt = 'val.txt'
+train_avi_txt = 'train_avi.txt'
+val_avi_txt = 'val_avi.txt'
 
-if not (os.path.exists(train_txt) and os.path.exists(val_txt)):
+if video_dir is not None:
+    if not (os.path.exists(train_avi_txt) and os.path.exists(val_avi_txt)):
+        video_data.generate_video_txt(video_dir, TRAIN_RATIO, train_avi_txt, val_avi_txt)
+elif not (os.path.exists(train_txt) and os.path.exists(val_txt)):
     input_data.generate_txt(data_dir, TRAIN_RATIO)
 
 if not os.path.exists('./model'):
@@ -37,13 +53,24 @@ if not os.path.exists('./model'):
 
 
 def train_running():
+    pipeline_tuner.set_budget(INPUT_THREADS)
     with tf.name_scope('input'):
 
-        train_batch, train_label_batch, _ = input_data.get_batch(train_txt, IMG_W, IMG_H, BATCH_SIZE, CAPACITY)
-        val_batch, val_label_batch, _ = input_data.get_batch(val_txt, IMG_W, IMG_H, BATCH_SIZE, CAPACITY)
-
-    x = tf.placeholder(tf.float32, shape=[BATCH_SIZE, IMG_W, IMG_H, 3])
-    y_ = tf.placeholder(tf.int32, shape=[BATCH_SIZE])
+        if video_dir is not None:
+            train_batch, train_label_batch, _ = video_data.get_video_batch(train_avi_txt, IMG_W, IMG_H, BATCH_SIZE, CAPACITY,
+                                                                           FRAME_STEP, augment=AUGMENT)
+            val_batch, val_label_batch, _ = video_data.get_video_batch(val_avi_txt, IMG_W, IMG_H, BATCH_SIZE, CAPACITY, FRAME_STEP)
+        elif MEMMAP is not None:
+            train_batch, train_label_batch, _ = memmap_data.get_memmap_batch(MEMMAP + '_train', IMG_W, IMG_H, BATCH_SIZE,
+                                                                             CAPACITY, train_txt, AUGMENT)
+            val_batch, val_label_batch, _ = memmap_data.get_memmap_batch(MEMMAP + '_val', IMG_W, IMG_H, BATCH_SIZE,
+                                                                         CAPACITY, val_txt)
+        else:
+            train_batch, train_label_batch, _ = input_data.get_batch(train_txt, IMG_W, IMG_H, BATCH_SIZE, CAPACITY, CACHE, AUGMENT)
+            val_batch, val_label_batch, _ = input_data.get_batch(val_txt, IMG_W, IMG_H, BATCH_SIZE, CAPACITY, CACHE)
+
+    x = train_loop.input_placeholder(train_batch)
+    y_ = train_loop.input_placeholder(train_label_batch)
 
     model = models.model(x, N_CLASSES)
     model.AlexNet()
@@ -56,45 +83,14 @@ def train_running():
     with tf.Session() as sess:
         saver = tf.train.Saver()
         sess.run(tf.global_variables_initializer())
-        coord = tf.train.Coordinator()
-        threads = tf.train.start_queue_runners(sess=sess, coord=coord)
 
         summary_op = tf.summary.merge_all()
         train_writer = tf.summary.FileWriter(logs_train_dir, sess.graph)
         val_writer = tf.summary.FileWriter(logs_val_dir, sess.graph)
 
-        try:
-            for step in np.arange(MAX_STEP):
-                if coord.should_stop():
-                    break
-
-                tra_images, tra_labels = sess.run([train_batch, train_label_batch])
-                _, tra_loss, tra_acc = sess.run([train_op, loss, acc],
-                                                feed_dict={x: tra_images, y_: tra_labels})
-
-                if step % 50 == 0:
-                    print('Step %d, train loss = %.4f, train accuracy = %.2f%%' % (step, tra_loss, tra_acc))
-                    summary_str = sess.run(summary_op, feed_dict={x: tra_images, y_: tra_labels})
-                    train_writer.add_summary(summary_str, step)
-                #
-                if step % 200 == 0 or (step + 1) == MAX_STEP:
-                    val_images, val_labels = sess.run([val_batch, val_label_batch])
-                    val_loss, val_acc = sess.run([loss, acc],
-                                                 feed_dict={x: val_images, y_: val_labels})
-
-                    print('**  Step %d, val loss = %.4f, val accuracy = %.2f%%  **' % (step, val_loss, val_acc))
-                    summary_str = sess.run(summary_op, feed_dict={x: val_images, y_: val_labels})
-                    val_writer.add_summary(summary_str, step)
-                    #
-                if step % 2000 == 0 or (step + 1) == MAX_STEP:
-                    checkpoint_path = os.path.join(model_dir, 'model.ckpt')
-                    saver.save(sess, checkpoint_path, global_step=step)
-
-        except tf.errors.OutOfRangeError:
-            print('Done training -- epoch limit reached')
-        finally:
-            coord.request_stop()
-        coord.join(threads)
+        train_loop.run_training(sess, train_op, loss, acc, MAX_STEP, model_dir, saver,
+                                val_inputs={x: val_batch, y_: val_label_batch},
+                                summary_op=summary_op, train_writer=train_writer, val_writer=val_writer)
 
 
 if __name__ == '__main__':
@@ -24,12 +24,18 @@ class myRNNConfig(object):
 class myRNN(object):
     """RNN模型"""
     
-    def __init__(self, config):
+    def __init__(self, config, input_x=None, input_y=None):
         
         self.config = config
-        # 待输入的数据
-        self.input_x = tf.placeholder(tf.float32, [None, self.config.timestep_size, self.config.input_size, 1], name='input_x')
-        self.input_y = tf.placeholder(tf.int32, [None], name='input_y')
+        # 待输入的数据, 给定输入管道的batch时直接接入计算图, 仍可以通过feed_dict输入
+        if input_x is None:
+            self.input_x = tf.placeholder(tf.float32, [None, self.config.timestep_size, self.config.input_size, 1], name='input_x')
+        else:
+            self.input_x = tf.placeholder_with_default(input_x, [None, self.config.timestep_size, self.config.input_size, 1], name='input_x')
+        if input_y is None:
+            self.input_y = tf.placeholder(tf.int32, [None], name='input_y')
+        else:
+            self.input_y = tf.placeholder_with_default(tf.cast(input_y, tf.int32), [None], name='input_y')
         self.batch_size = tf.placeholder(tf.int32, [], name='batch_size') 
         self.keep_prob = tf.placeholder(tf.float32, [], name='keep_prob')
         self.rnn()
@@ -8,10 +8,15 @@ Created on Thu Mar 29 08:03:17 2018
 
 #%%
 
+import sys
 import tensorflow as tf
 import numpy as np
 import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from augment import augment_batch
 import math
+import pipeline_tuner
+from image_utils import batch_standardization, get_cached_batch
 
 #%%
 
@@ -56,7 +61,21 @@ def get_files(file_dir, ratio, ret_val_num=False):
 
 #%%
 
-def get_batch(image, label, image_W, image_H, batch_size, capacity):
+def decode_and_crop_or_pad(image_contents, target_height, target_width, channels=3):
+    '''same as decode_jpeg + resize_image_with_crop_or_pad, but only the centre
+    crop window is decoded, the window is computed from the JPEG header
+    '''
+    shape = tf.image.extract_jpeg_shape(image_contents)
+    crop_height = tf.minimum(shape[0], target_height)
+    crop_width = tf.minimum(shape[1], target_width)
+    crop_window = tf.stack([(shape[0] - crop_height) // 2, (shape[1] - crop_width) // 2,
+                            crop_height, crop_width])
+    image = tf.image.decode_and_crop_jpeg(image_contents, crop_window, channels=channels)
+    # only pads now, if the image is smaller than the target
+    return tf.image.resize_image_with_crop_or_pad(image, target_height, target_width)
+
+
+def get_batch(image, label, image_W, image_H, batch_size, capacity, cache=None, augment=None):
     '''
     Args:
         image: list type
@@ -65,11 +84,22 @@ def get_batch(image, label, image_W, image_H, batch_size, capacity):
         image_H: image height
         batch_size: batch size
         capacity: the maximum elements in queue
+        cache: None, decode every image in every epoch with the queue runners
+               'memory', keep the decoded and resized uint8 images in RAM
+               a directory, keep them in a cache file there, for datasets
+               larger than RAM
+        augment: None, or a policy dict of augment.augment_batch, the random
+                 crop/flip/brightness/contrast is applied to the whole uint8
+                 batch after dequeue
     Returns:
         image_batch: 4D tensor [batch_size, width, height, 3], dtype=tf.float32
         label_batch: 1D tensor [batch_size], dtype=tf.int32
     '''
     
+    if cache is not None:
+        return get_cached_batch(np.array(image), np.array(label), image_W, image_H, batch_size, capacity, cache, augment=augment,
+                                method='crop_or_pad', decode=lambda contents: decode_and_crop_or_pad(contents, image_W, image_H))
+
     image = tf.cast(image, tf.string)
     label = tf.cast(label, tf.int64)
 
@@ -78,24 +108,22 @@ def get_batch(image, label, image_W, image_H, batch_size, capacity):
     
     label = input_queue[1]
     image_contents = tf.read_file(input_queue[0])
-    image = tf.image.decode_jpeg(image_contents, channels=3)
+    image = decode_and_crop_or_pad(image_contents, image_W, image_H)
     
     ######################################
-    # data argumentation should go to here
+    # data augmentation is done on the whole batch after dequeue, see augment
     ######################################
     
-    image = tf.image.resize_image_with_crop_or_pad(image, image_W, image_H)    
     # if you want to test the generated batches of images, you might want to comment the following line.
     
-    image = tf.image.per_image_standardization(image)
+    # keep uint8 in the queue, the whole batch is standardized after dequeue
     
-    image_batch, label_batch = tf.train.batch([image, label],
-                                                batch_size= batch_size,
-                                                num_threads= 64, 
-                                                capacity = capacity)
+    image_batch, label_batch = pipeline_tuner.batch([image, label], batch_size, capacity)
     
     label_batch = tf.reshape(label_batch, [batch_size])
-    image_batch = tf.cast(image_batch, tf.float32)
+    if augment is not None:
+        image_batch = augment_batch(image_batch, augment)
+    image_batch = batch_standardization(image_batch)
     
     return image_batch, label_batch
 
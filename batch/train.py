@@ -6,12 +6,14 @@ Created on Thu Mar 29 08:03:51 2018
 @author: zhong
 """
 
+import sys
 import os
-import numpy as np
 import tensorflow as tf
 import input_data
 import models
 import tools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import train_loop
 
 N_CLASSES = 6
 IMG_W = 120  # resize the image, if the input image is too large, training will be very slow.
@@ -19,6 +21,7 @@ IMG_H = 120
 RATIO = 0.2 # take 20% of dataset as validation data 
 BATCH_SIZE = 100
 CAPACITY = 2000
+CACHE = None  # None, 'memory' or a directory: cache the decoded images after the first epoch
 MAX_STEP = 30000 # with current parameters, it is suggested to use MAX_STEP>10k
 LEARNING_RATE = 1e-3 # with current parameters, it is suggested to use learning rate<0.0001
 
@@ -32,18 +35,20 @@ train_batch, train_label_batch = input_data.get_batch(train_image,
                                               IMG_W,
                                               IMG_H,
                                               BATCH_SIZE, 
-                                              CAPACITY)
+                                              CAPACITY,
+                                              CACHE)
 val_batch, val_label_batch = input_data.get_batch(val_image,
                                               val_label,
                                               IMG_W,
                                               IMG_H,
                                               BATCH_SIZE, 
-                                              CAPACITY)
+                                              CAPACITY,
+                                              CACHE)
 
 def train_running():
     
-    x = tf.placeholder(tf.float32, shape=[BATCH_SIZE, IMG_W, IMG_H, 3])
-    y_ = tf.placeholder(tf.int32, shape=[BATCH_SIZE])
+    x = train_loop.input_placeholder(train_batch)
+    y_ = train_loop.input_placeholder(train_label_batch)
     
     logits = models.AlexNet(x, N_CLASSES)
     loss = tools.loss(logits, y_)  
@@ -54,43 +59,14 @@ def train_running():
     with tf.Session() as sess:
         saver = tf.train.Saver()
         sess.run(tf.global_variables_initializer())
-        coord = tf.train.Coordinator()
-        threads = tf.train.start_queue_runners(sess= sess, coord=coord)
-        
-        summary_op = tf.summary.merge_all()        
+
+        summary_op = tf.summary.merge_all()
         train_writer = tf.summary.FileWriter(logs_train_dir, sess.graph)
         val_writer = tf.summary.FileWriter(logs_val_dir, sess.graph)
-    
-        try:
-            for step in np.arange(MAX_STEP):
-                if coord.should_stop():
-                        break
-                
-                tra_images,tra_labels = sess.run([train_batch, train_label_batch])
-                _, tra_loss, tra_acc = sess.run([train_op, loss, acc],feed_dict={x:tra_images, y_:tra_labels})
-                
-                if step % 50 == 0:
-                    print('Step %d, train loss = %.4f, train accuracy = %.2f%%' %(step, tra_loss, tra_acc*100.0))
-                    summary_str = sess.run(summary_op, feed_dict={x:tra_images, y_:tra_labels})
-                    train_writer.add_summary(summary_str, step)
-    #                
-                if step % 200 == 0 or (step + 1) == MAX_STEP:
-                    val_images, val_labels = sess.run([val_batch, val_label_batch])
-                    val_loss, val_acc = sess.run([loss, acc], feed_dict={x:val_images, y_:val_labels})
-                    
-                    print('**  Step %d, val loss = %.4f, val accuracy = %.2f%%  **' %(step, val_loss, val_acc*100.0))
-                    summary_str = sess.run(summary_op, feed_dict={x:val_images, y_:val_labels})
-                    val_writer.add_summary(summary_str, step)  
-    #                                
-                if step % 2000 == 0 or (step + 1) == MAX_STEP:
-                    checkpoint_path = os.path.join(model_dir, 'model.ckpt')
-                    saver.save(sess, checkpoint_path, global_step=step)
-                    
-        except tf.errors.OutOfRangeError:
-            print('Done training -- epoch limit reached')
-        finally:
-            coord.request_stop()           
-        coord.join(threads)
+
+        train_loop.run_training(sess, train_op, loss, acc, MAX_STEP, model_dir, saver,
+                                val_inputs={x: val_batch, y_: val_label_batch},
+                                summary_op=summary_op, train_writer=train_writer, val_writer=val_writer)
  
 if __name__ == '__main__':
     train_running()
@@ -7,10 +7,14 @@ Created on Thu Mar 29 08:03:17 2018
 """
 
 
+import sys
 import tensorflow as tf
 import numpy as np
 import os
-import math
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'common'))
+from augment import augment_batch
+import pipeline_tuner
+from image_utils import jpeg_size, decode_ratio, batch_standardization, get_cached_batch
 
 
 def getPerActionList(actionPath):
@@ -73,7 +77,18 @@ def generate_txt(data_dir, ratio):
     print('Testing num: %d' % test_num)
 
 
-def get_batch(file, image_W, image_H, batch_size, capacity):
+def get_batch(file, image_W, image_H, batch_size, capacity, cache=None, augment=None):
+    '''
+    Args:
+        file: txt file written by generate_txt, 'image label' per line
+        cache: None, decode every image in every epoch with the queue runners
+               'memory', keep the decoded and resized uint8 images in RAM
+               a directory, keep them in a cache file there, for datasets
+               larger than RAM
+        augment: None, or a policy dict of augment.augment_batch, the random
+                 crop/flip/brightness/contrast is applied to the whole uint8
+                 batch after dequeue
+    '''
 
     img_label = []
     with open(file, 'r') as file_to_read:
@@ -87,6 +102,12 @@ def get_batch(file, image_W, image_H, batch_size, capacity):
         label = np.int32(label)
 
     num = len(img)
+    # decode at 1/ratio of the size straight in the DCT domain, the resize has less to do
+    ratio = decode_ratio(img[0], image_W, image_H)
+    if cache is not None:
+        image_batch, label_batch = get_cached_batch(img, label, image_W, image_H, batch_size, capacity, cache, augment=augment, ratio=ratio)
+        return image_batch, label_batch, num
+
     image = tf.cast(img, tf.string)
     label = tf.cast(label, tf.int64)
 
@@ -95,23 +116,23 @@ def get_batch(file, image_W, image_H, batch_size, capacity):
     
     label = input_queue[1]
     image_contents = tf.read_file(input_queue[0])
-    image = tf.image.decode_jpeg(image_contents, channels=3)
+    image = tf.image.decode_jpeg(image_contents, channels=3, ratio=ratio)
     
     ######################################
-    # data argumentation should go to here
+    # data augmentation is done on the whole batch after dequeue, see augment
     ######################################
 
     # image = tf.image.resize_image_with_crop_or_pad(image, image_W, image_H)
     image = tf.image.resize_images(image, [image_W, image_H], method=0)
-    image = tf.image.per_image_standardization(image)
+    # keep uint8 in the queue, the whole batch is standardized after dequeue
+    image = tf.saturate_cast(tf.round(image), tf.uint8)
 
-    image_batch, label_batch = tf.train.batch([image, label],
-                                              batch_size=batch_size,
-                                              num_threads=64,
-                                              capacity=capacity)
+    image_batch, label_batch = pipeline_tuner.batch([image, label], batch_size, capacity)
     
     label_batch = tf.reshape(label_batch, [batch_size])
-    image_batch = tf.cast(image_batch, tf.float32)
+    if augment is not None:
+        image_batch = augment_batch(image_batch, augment)
+    image_batch = batch_standardization(image_batch)
     
     return image_batch, label_batch, num
 
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Throughput benchmark of the input pipelines.
+
+Every loader runs alone, with no model, in its own process started in its
+experiment directory (each directory imports its own input_data). For every
+thread count and batch size the process takes --warmup batches (queue
+filling, record/cache building), then times --batches batches and reports
+    images_per_sec       images of the timed batches / wall time
+    bytes_per_sec        bytes of the timed image batches / wall time
+    image_shape, dtype   of one image as the loader gives it
+    latency_p50/p99_ms   time of one sess.run / next_batch
+    cpu_percent          user + system time of the process / wall time,
+                         100 is one busy core
+    peak_rss_mb          peak resident memory of the process
+    threads_reached      enqueue/decode threads actually running, the
+                         queue-runner loaders are pinned to the thread count
+                         instead of being tuned
+All results go to one JSON file:
+
+    python input_benchmark.py --loaders CNN tfrecond cifar10 --threads 4 8 16
+                              --batch_sizes 64 128 --batches 200
+                              --list ../CNN/train.txt --size 80 60
+
+images_per_sec is only comparable between loaders that read the same images
+at the same size. --list ('image label' per line, relative paths are taken
+from the directory of the list) is fed to every loader that reads such a
+list (LIST_LOADERS), --size to every loader that resizes or crops (SIZE_LOADERS).
+The other loaders read the data of their experiment, at their own size
+(cifar10, mnist: the fixed datasets, tfrecond: the records, batch,
+cats_vs_dogs: a directory tree, two-stream: RGB/flow pairs, data_generator:
+PNG at 80x60), the "dataset" and "image_shape" of a row say so, compare them
+by bytes_per_sec rather than images_per_sec.
+
+Loaders that have no thread setting (mnist, cifar10_in_memory, CNN_memmap)
+run once per batch size with "threads": null.
+
+@author: zhong
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import numpy as np
+from multiprocessing import cpu_count
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIN_AFTER_DEQUENE = 512
+CAPACITY = 2000
+
+#%% builders, run inside the experiment directory
+def _set_queue_threads(num_threads):
+    '''the queue-runner loaders take their threads from the pipeline_tuner budget,
+    pinned to num_threads from the start, the tuner would start at one thread
+    and add one every pipeline_tuner.INTERVAL seconds, the sweep would measure the ramp-up
+    '''
+    import pipeline_tuner
+    pipeline_tuner.set_budget(num_threads, fixed=True)
+
+
+def _threads_reached(num_threads):
+    '''enqueue threads the queue-runner pipelines run, num_threads for the tf.data loaders'''
+    pipeline_tuner = sys.modules.get('pipeline_tuner')
+    if pipeline_tuner is not None:
+        budget = pipeline_tuner.default_budget()
+        if budget.pipelines:
+            return budget.used()
+    return num_threads
+
+
+def _session_runner(fetches, init_ops=()):
+    '''a function that runs one batch, the iterators are restarted at the end of an epoch'''
+    import tensorflow as tf
+    sess = tf.Session()
+    sess.run([tf.global_variables_initializer(), tf.local_variables_initializer()])
+    sess.run(list(init_ops))
+    coord = tf.train.Coordinator()
+    threads = tf.train.start_queue_runners(sess=sess, coord=coord)
+
+    def next_batch():
+        try:
+            return sess.run(fetches)
+        except tf.errors.OutOfRangeError:
+            if not init_ops:
+                raise
+            sess.run(list(init_ops))
+            return sess.run(fetches)
+
+    def close():
+        coord.request_stop()
+        coord.join(threads, stop_grace_period_secs=5)
+        sess.close()
+
+    return next_batch, close
+
+
+def txt_get_batch(image_W, image_H, file='train.txt'):
+    '''get_batch(file, W, H, batch_size, capacity) of the txt-list experiments'''
+    def build(batch_size, num_threads, image_list=None, size=None):
+        import input_data
+        _set_queue_threads(num_threads)
+        W, H = size or (image_W, image_H)
+        batches = input_data.get_batch(image_list or file, W, H, batch_size, CAPACITY)
+        return _session_runner(list(batches[:-1]))
+    return build
+
+
+def files_get_batch(image_W, image_H, data_dir, ratio=0.2):
+    '''get_files + get_batch(image, label, ...) of batch and cats_vs_dogs'''
+    def build(batch_size, num_threads, image_list=None, size=None):
+        import input_data
+        _set_queue_threads(num_threads)
+        W, H = size or (image_W, image_H)
+        files = input_data.get_files(data_dir, ratio)
+        image_batch, label_batch = input_data.get_batch(files[0], files[1], W, H, batch_size, CAPACITY)
+        return _session_runner([image_batch, label_batch])
+    return build
+
+
+def build_cnn_memmap(batch_size, num_threads, image_list=None, size=None):
+    '''memmap_data of CNN, the arrays are built next to the list before the timing,
+    the decode processes of build_memmap do not count
+    '''
+    import memmap_data
+    W, H = size or (80, 60)
+    file = image_list or 'train.txt'
+    prefix = '%s_%dx%d' % (os.path.splitext(os.path.abspath(file))[0], W, H)
+    image_batch, label_batch, _ = memmap_data.get_memmap_batch(prefix, W, H, batch_size, CAPACITY, file)
+    return _session_runner([image_batch, label_batch])
+
+
+def build_data_batch(batch_size, num_threads, image_list=None, size=None):
+    import get_batch
+    W, H = size or (224, 224)
+    image_batch, label_batch = get_batch.get_batch(image_list or 'datalist.txt', W, H, batch_size, num_threads=num_threads)
+    return _session_runner([image_batch, label_batch])
+
+
+def build_tfrecond(batch_size, num_threads, image_list=None, size=None):
+    import input_data
+    _set_queue_threads(num_threads)
+    W, H = size or (80, 60)
+    image_batch, label_batch = input_data.read_and_decode('train.tfrecords', W, H, batch_size, MIN_AFTER_DEQUENE)
+    return _session_runner([image_batch, label_batch])
+
+
+def build_tfrecond_shards(batch_size, num_threads, image_list=None, size=None):
+    import input_data
+    W, H = size or (80, 60)
+    image_batch, label_batch = input_data.read_and_decode_shards('train-*-of-*.tfrecords', W, H, batch_size,
+                                                                 MIN_AFTER_DEQUENE, num_parallel_calls=num_threads,
+                                                                 compression=input_data.record_compression('train'),
+                                                                 encoding=input_data.record_encoding('train'))
+    return _session_runner([image_batch, label_batch])
+
+
+def build_cifar10(batch_size, num_threads, image_list=None, size=None):
+    import cifar10_input
+    _set_queue_threads(num_threads)
+    image_batch, label_batch = cifar10_input.read_cifar10('./data/', True, batch_size, True)
+    return _session_runner([image_batch, label_batch])
+
+
+def build_cifar10_in_memory(batch_size, num_threads, image_list=None, size=None):
+    import cifar10_input
+    image_batch, label_batch = cifar10_input.read_cifar10_in_memory('./data/', True, batch_size, True)
+    return _session_runner([image_batch, label_batch])
+
+
+def build_data_generator(batch_size, num_threads, image_list=None, size=None):
+    import data_generator
+    data = data_generator.ImageDataGenerator('./train.txt', 'training', batch_size, 6, num_threads=num_threads)
+    iterator = data.data.make_initializable_iterator()
+    return _session_runner(list(iterator.get_next()), [iterator.initializer])
+
+
+def build_mnist(batch_size, num_threads, image_list=None, size=None):
+    from tensorflow.examples.tutorials.mnist import input_data
+    mnist = input_data.read_data_sets('../MNIST_data/', one_hot=True)
+    return (lambda: mnist.train.next_batch(batch_size)), (lambda: None)
+
+
+# name: (experiment directory, builder, takes a thread count)
+LOADERS = {
+    'CNN': ('CNN', txt_get_batch(80, 60), True),
+    'CNN_memmap': ('CNN', build_cnn_memmap, False),
+    'LSTM': ('LSTM', txt_get_batch(120, 80), True),
+    'CNN-LSTM': ('CNN-LSTM', txt_get_batch(80, 60), True),
+    'feature_extract': ('feature_extract', txt_get_batch(80, 60), True),
+    'confusion_matrix': ('confusion_matrix', txt_get_batch(120, 80), True),
+    'batch': ('batch', files_get_batch(120, 120, './data/KTH_RGB/'), True),
+    'batch_version2': ('batch/version2', txt_get_batch(120, 80), True),
+    'cats_vs_dogs': ('cats_vs_dogs', files_get_batch(208, 208, './data/'), True),
+    'two-stream': ('two-stream', txt_get_batch(120, 120), True),
+    'data_batch': ('data_batch', build_data_batch, True),
+    'tfrecond': ('tfrecond', build_tfrecond, True),
+    'tfrecond_shards': ('tfrecond', build_tfrecond_shards, True),
+    'cifar10': ('CIFAR10', build_cifar10, True),
+    'cifar10_in_memory': ('CIFAR10', build_cifar10_in_memory, False),
+    'data_generator': ('data_generator_batch', build_data_generator, True),
+    'mnist': ('MNIST', build_mnist, False),
+}
+
+# loaders that read an 'image label' list, they all take --list
+LIST_LOADERS = ('CNN', 'CNN_memmap', 'LSTM', 'CNN-LSTM', 'feature_extract', 'confusion_matrix', 'batch_version2', 'data_batch')
+# loaders that take --size as their output size (tfrecond crops the records to it)
+SIZE_LOADERS = LIST_LOADERS + ('batch', 'cats_vs_dogs', 'tfrecond', 'tfrecond_shards')
+
+#%% one configuration, in the worker process
+def run_worker(name, batch_size, num_threads, num_batches, warmup, image_list=None, size=None):
+    '''time num_batches batches of one loader
+    Args:
+        image_list: None, or the common 'image label' list, for LIST_LOADERS
+        size: None, or the common (W, H), for SIZE_LOADERS
+    Returns:
+        dict of the measurements
+    '''
+    sys.path.insert(0, os.getcwd())
+    sys.path.append(os.path.join(ROOT, 'common'))
+    image_list = image_list if name in LIST_LOADERS else None
+    size = size if name in SIZE_LOADERS else None
+    next_batch, close = LOADERS[name][1](batch_size, num_threads, image_list, size)
+    try:
+        for _ in range(warmup):
+            next_batch()
+
+        latencies = []
+        images = 0
+        image_bytes = 0
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.time()
+        for _ in range(num_batches):
+            t = time.time()
+            batch = next_batch()
+            latencies.append(time.time() - t)
+            images += len(batch[0])
+            image_bytes += np.asarray(batch[0]).nbytes
+        wall = time.time() - start
+        end_usage = resource.getrusage(resource.RUSAGE_SELF)
+        threads_reached = _threads_reached(num_threads)
+    finally:
+        close()
+
+    cpu = (end_usage.ru_utime - usage.ru_utime) + (end_usage.ru_stime - usage.ru_stime)
+    latencies = np.array(latencies) * 1000
+    image = np.asarray(batch[0])
+    return {'threads_reached': threads_reached,
+            'dataset': image_list or 'own',
+            'image_shape': list(image.shape[1:]),
+            'dtype': str(image.dtype),
+            'images': images,
+            'seconds': wall,
+            'images_per_sec': images / wall,
+            'bytes_per_sec': image_bytes / wall,
+            'latency_p50_ms': float(np.percentile(latencies, 50)),
+            'latency_p99_ms': float(np.percentile(latencies, 99)),
+            'cpu_percent': 100.0 * cpu / wall,
+            # ru_maxrss is in kilobytes on Linux, bytes on macOS
+            'peak_rss_mb': end_usage.ru_maxrss / (1024.0 ** 2 if sys.platform == 'darwin' else 1024.0)}
+
+#%% the sweep, in the parent process
+def absolute_list(file, output):
+    '''copy of an 'image label' list with absolute image paths, relative ones
+    are taken from the directory of the list
+    Returns:
+        path of the copy, next to the benchmark output
+    '''
+    base = os.path.dirname(os.path.abspath(file))
+    out = os.path.join(os.path.dirname(os.path.abspath(output)), 'input_benchmark_list.txt')
+    with open(file, 'r') as f, open(out, 'w') as g:
+        for line in f:
+            tmp = line.strip('\n').split(' ')
+            if tmp[0]:
+                tmp[0] = os.path.normpath(os.path.join(base, tmp[0]))
+                g.write(' '.join(tmp) + '\n')
+    return out
+
+
+def run_config(name, batch_size, num_threads, args):
+    '''run one configuration in a fresh process in the directory of the loader'''
+    command = [sys.executable, os.path.abspath(__file__), '--worker', name,
+               '--batch_sizes', str(batch_size), '--batches', str(args.batches), '--warmup', str(args.warmup)]
+    if num_threads is not None:
+        command += ['--threads', str(num_threads)]
+    if args.list:
+        command += ['--list', args.list]
+    if args.size:
+        command += ['--size'] + [str(x) for x in args.size]
+    env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL='2')
+    result = {'loader': name, 'batch_size': batch_size, 'threads': num_threads}
+    try:
+        proc = subprocess.run(command, cwd=os.path.join(ROOT, LOADERS[name][0]), env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True, timeout=args.timeout)
+    except subprocess.TimeoutExpired:
+        result['error'] = 'timeout after %d s' % args.timeout
+        return result
+    lines = proc.stdout.strip().split('\n')
+    if proc.returncode != 0 or not lines[-1].startswith('{'):
+        result['error'] = proc.stderr.strip().split('\n')[-1]
+    else:
+        result.update(json.loads(lines[-1]))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput benchmark of the input pipelines')
+    parser.add_argument('--loaders', nargs='+', default=sorted(LOADERS), choices=sorted(LOADERS))
+    parser.add_argument('--threads', nargs='+', type=int, default=[1, 4, max(cpu_count() // 2, 1), cpu_count()])
+    parser.add_argument('--batch_sizes', nargs='+', type=int, default=[32, 128])
+    parser.add_argument('--batches', type=int, default=100, help='timed batches per configuration')
+    parser.add_argument('--warmup', type=int, default=10, help='untimed batches before')
+    parser.add_argument('--timeout', type=int, default=1800, help='seconds per configuration')
+    parser.add_argument('--list', help="common 'image label' list of the list loaders")
+    parser.add_argument('--size', nargs=2, type=int, metavar=('W', 'H'), help='common image size')
+    parser.add_argument('--output', default='input_benchmark.json')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        num_threads = args.threads[0] if LOADERS[args.worker][2] else None
+        print(json.dumps(run_worker(args.worker, args.batch_sizes[0], num_threads, args.batches, args.warmup,
+                                    args.list, args.size)))
+        return
+
+    if args.list:
+        # the workers run in other directories, give them absolute paths
+        args.list = absolute_list(args.list, args.output)
+
+    results = []
+    for name in args.loaders:
+        thread_counts = sorted(set(args.threads)) if LOADERS[name][2] else [None]
+        for batch_size in args.batch_sizes:
+            for num_threads in thread_counts:
+                result = run_config(name, batch_size, num_threads, args)
+                results.append(result)
+                if 'error' in result:
+                    print('%-18s batch %4d threads %4s: %s' % (name, batch_size, num_threads, result['error']))
+                else:
+                    print('%-18s batch %4d threads %4s: %8.1f images/sec, %7.1f MB/sec %-14s, p50 %7.1f ms, p99 %7.1f ms, '
+                          'cpu %5.0f%%, rss %6.0f MB'
+                          % (name, batch_size, num_threads, result['images_per_sec'], result['bytes_per_sec'] / 2 ** 20,
+                             'x'.join(str(x) for x in result['image_shape']), result['latency_p50_ms'],
+                             result['latency_p99_ms'], result['cpu_percent'], result['peak_rss_mb']))
+
+    report = {'host': {'platform': platform.platform(),
+                       'python': platform.python_version(),
+                       'cpu_count': cpu_count()},
+              'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+              'batches': args.batches,
+              'warmup': args.warmup,
+              'list': args.list,
+              'size': args.size,
+              'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Results written to %s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
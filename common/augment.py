@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch-level data augmentation.
+
+The per-image random_crop / random_flip_left_right / random_brightness /
+random_contrast ops run once per example in the queue runners. augment_batch
+draws the random parameters per sample but applies each of them to the whole
+batch with one vectorised op, so augmentation can be switched on without
+slowing down the input pipeline.
+
+Shared by the input pipelines of the experiment directories, which put
+'../common' on sys.path.
+
+@author: zhong
+"""
+
+import tensorflow as tf
+
+# crop: None or [height, width] of the random crop
+# flip: random left-right flip
+# brightness: None or max delta added to the pixels, like random_brightness
+# contrast: None or [lower, upper] of the contrast factor, like random_contrast
+# seed: None or graph-level reproducible seed
+DEFAULT_POLICY = {'crop': None,
+                  'flip': True,
+                  'brightness': 63,
+                  'contrast': [0.2, 1.8],
+                  'seed': None}
+
+#%%
+def augment_batch(image_batch, policy=None):
+    '''random crop, flip, brightness and contrast of a whole batch
+    Args:
+        image_batch: 4D tensor [batch_size, height, width, channel], uint8 or float in [0, 255]
+        policy: dict, keys of DEFAULT_POLICY, missing keys take the default
+    Returns:
+        4D float32 tensor in [0, 255], [batch_size, crop height, crop width, channel] if crop
+    '''
+    policy = dict(DEFAULT_POLICY, **(policy or {}))
+    seed = policy['seed']
+
+    def op_seed(i):
+        # every op draws from its own stream, the whole policy is reproducible from one seed
+        return None if seed is None else seed + i
+
+    with tf.name_scope('augment'):
+        x = tf.cast(image_batch, tf.float32)
+        batch_size = tf.shape(x)[0]
+
+        if policy['crop'] is not None:
+            height, width = x.get_shape().as_list()[1:3]
+            crop_h, crop_w = policy['crop']
+            offset_h = tf.random_uniform([batch_size], 0, height - crop_h + 1, dtype=tf.int32, seed=op_seed(0))
+            offset_w = tf.random_uniform([batch_size], 0, width - crop_w + 1, dtype=tf.int32, seed=op_seed(1))
+            offset_h = tf.cast(offset_h, tf.float32)
+            offset_w = tf.cast(offset_w, tf.float32)
+            # normalized boxes on whole pixels, crop_and_resize then copies the pixels of every crop
+            boxes = tf.stack([offset_h / (height - 1),
+                              offset_w / (width - 1),
+                              (offset_h + crop_h - 1) / (height - 1),
+                              (offset_w + crop_w - 1) / (width - 1)], axis=1)
+            x = tf.image.crop_and_resize(x, boxes, tf.range(batch_size), [crop_h, crop_w])
+
+        if policy['flip']:
+            flip = tf.random_uniform([batch_size], seed=op_seed(2)) < 0.5
+            x = tf.where(flip, tf.reverse(x, axis=[2]), x)
+
+        if policy['brightness'] is not None:
+            delta = policy['brightness']
+            x = x + tf.random_uniform([batch_size, 1, 1, 1], -delta, delta, seed=op_seed(3))
+
+        if policy['contrast'] is not None:
+            lower, upper = policy['contrast']
+            factor = tf.random_uniform([batch_size, 1, 1, 1], lower, upper, seed=op_seed(4))
+            mean = tf.reduce_mean(x, axis=[1, 2], keep_dims=True)
+            x = (x - mean) * factor + mean
+
+        return tf.clip_by_value(x, 0.0, 255.0)
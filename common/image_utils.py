@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Image helpers and tf.data list pipelines shared by the input_data modules of
+the experiment directories.
+
+The experiment directories put '../common' on sys.path and import the helpers
+into their input_data, so input_data.batch_standardization etc. keep working.
+
+@author: zhong
+"""
+
+import os
+import struct
+import hashlib
+import numpy as np
+import tensorflow as tf
+from augment import augment_batch
+
+#%%
+def jpeg_size(path):
+    '''(height, width) from the SOF header of a JPEG file
+    Returns:
+        (height, width), None if the file is not a JPEG or is cut short before the SOF
+    '''
+    with open(path, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            return None
+        while True:
+            byte = f.read(1)
+            if byte != b'\xff':
+                return None
+            # a marker may be preceded by any number of 0xFF fill bytes
+            while byte == b'\xff':
+                byte = f.read(1)
+            if not byte:
+                return None
+            code = ord(byte)
+            # TEM (01), RST0..RST7 (D0..D7) and SOI (D8) have no length field
+            if code == 0x01 or 0xD0 <= code <= 0xD8:
+                continue
+            # 00 is no marker, EOI (D9) and SOS (DA) mean there is no SOF before the image data
+            if code in (0x00, 0xD9, 0xDA):
+                return None
+            length = f.read(2)
+            if len(length) < 2:
+                return None
+            # SOF0..SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+            if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+                header = f.read(5)
+                if len(header) < 5:
+                    return None
+                return struct.unpack('>HH', header[1:5])
+            length = struct.unpack('>H', length)[0]
+            if length < 2:
+                return None
+            f.seek(length - 2, 1)
+
+
+def decode_ratio(path, image_W, image_H):
+    '''largest DCT-domain downscale of decode_jpeg (8, 4 or 2) that still decodes
+    the image to at least [image_W, image_H], the frames of a dataset have one
+    size, so the first image decides. 1 if the image is not a JPEG.
+    '''
+    size = jpeg_size(path)
+    if size is None:
+        return 1
+    rows, cols = size
+    for ratio in (8, 4, 2):
+        if rows // ratio >= image_W and cols // ratio >= image_H:
+            return ratio
+    return 1
+
+
+def batch_standardization(image_batch):
+    '''per_image_standardization of a whole uint8 batch [batch_size, width, height, channel] in one op
+    Args:
+        image_batch: 4D tensor, uint8 or float
+    Returns:
+        4D float32 tensor, every image has zero mean and unit variance
+    '''
+    image_batch = tf.cast(image_batch, tf.float32)
+    mean, variance = tf.nn.moments(image_batch, axes=[1,2,3], keep_dims=True)
+    num_elements = tf.cast(tf.reduce_prod(tf.shape(image_batch)[1:]), tf.float32)
+    adjusted_stddev = tf.maximum(tf.sqrt(variance), tf.rsqrt(num_elements))
+    return (image_batch - mean) / adjusted_stddev
+
+
+#%% tf.data pipelines over an image list
+def decoded_cache_name(img, label, image_W, image_H, method, cache_dir):
+    '''name of the decoded-image cache file
+    The name is keyed by the image list, the labels, the target size and the
+    resize method, changing any of them gives a new name, so a stale cache is
+    never read.
+    '''
+    key = hashlib.md5()
+    for i, l in zip(img, label):
+        key.update(('%s %d\n' % (i, int(l))).encode('utf-8'))
+    key.update(('%dx%d %s' % (image_W, image_H, method)).encode('utf-8'))
+    return os.path.join(cache_dir, 'decoded_%dx%d_%s_%s' % (image_W, image_H, method, key.hexdigest()))
+
+
+def _decode_resize(image_W, image_H, ratio, channels):
+    '''decode_jpeg at 1/ratio in the DCT domain and resize to [image_W, image_H]'''
+    def decode(image_contents):
+        image = tf.image.decode_jpeg(image_contents, channels=channels, ratio=ratio)
+        return tf.image.resize_images(image, [image_W, image_H], method=0)
+    return decode
+
+
+def get_cached_batch(img, label, image_W, image_H, batch_size, capacity, cache, num_threads=16, augment=None,
+                     ratio=1, channels=3, decode=None, method=None):
+    '''same batches as get_batch, but every image is read, decoded and resized only
+    once, the resized uint8 images are cached and served from the cache from the
+    second epoch on.
+    Args:
+        img: array of image directories
+        label: array of labels
+        cache: 'memory' to keep the cache in RAM, else the directory of the cache file
+        num_threads: number of parallel decode calls of the first epoch
+        augment: None, or a policy dict of augment.augment_batch
+        ratio: DCT downscale of decode_jpeg, see decode_ratio
+        channels: 3, or 1 to decode straight to grayscale
+        decode: None for decode_jpeg + bilinear resize, else a function of the
+                file contents giving an image [image_W, image_H, channels]
+        method: name of decode in the cache name, needed with decode
+    Returns:
+        image_batch: 4D tensor [batch_size, width, height, channels], dtype=tf.float32
+        label_batch: 1D tensor [batch_size], dtype=tf.int64
+    '''
+    if decode is None:
+        decode = _decode_resize(image_W, image_H, ratio, channels)
+        method = 'bilinear_r%d' % ratio + ('_gray' if channels == 1 else '')
+    if cache == 'memory':
+        filename = ''
+    else:
+        if not os.path.exists(cache):
+            os.makedirs(cache)
+        filename = decoded_cache_name(img, label, image_W, image_H, method, cache)
+
+    def decode_file(path, label):
+        image = decode(tf.read_file(path))
+        if image.dtype != tf.uint8:
+            image = tf.saturate_cast(tf.round(image), tf.uint8)
+        return image, label
+
+    dataset = tf.data.Dataset.from_tensor_slices((img, np.int64(label)))
+    dataset = dataset.map(decode_file, num_parallel_calls=num_threads)
+    dataset = dataset.cache(filename)
+    dataset = dataset.shuffle(capacity).repeat()
+    dataset = dataset.apply(tf.contrib.data.batch_and_drop_remainder(batch_size))
+    dataset = dataset.prefetch(1)
+
+    image_batch, label_batch = dataset.make_one_shot_iterator().get_next()
+    if augment is not None:
+        image_batch = augment_batch(image_batch, augment)
+    image_batch = batch_standardization(image_batch)
+
+    return image_batch, label_batch
+
+
+def get_ordered_batch(img, label, image_W, image_H, batch_size, capacity, num_threads=16, ratio=1, channels=3):
+    '''(image, label) batches in the order of the list, for evaluation and feature extraction
+    The images are decoded by num_threads parallel map calls, map puts every
+    result back in its place, so the order does not depend on the threads.
+    The list is repeated, a last batch that is not full wraps around to the start.
+    Args:
+        img: array of image directories
+        label: array of labels
+        capacity: number of images prefetched
+        num_threads: number of parallel decode calls
+        ratio: DCT downscale of decode_jpeg, see decode_ratio
+        channels: 3, or 1 to decode straight to grayscale
+    Returns:
+        image_batch: 4D tensor [batch_size, width, height, channels], dtype=tf.float32
+        label_batch: 1D tensor [batch_size], dtype=tf.int64
+    '''
+    decode = _decode_resize(image_W, image_H, ratio, channels)
+
+    def decode_file(path, label):
+        image = tf.saturate_cast(tf.round(decode(tf.read_file(path))), tf.uint8)
+        return image, label
+
+    dataset = tf.data.Dataset.from_tensor_slices((img, np.int64(label)))
+    dataset = dataset.map(decode_file, num_parallel_calls=num_threads)
+    dataset = dataset.repeat()
+    dataset = dataset.apply(tf.contrib.data.batch_and_drop_remainder(batch_size))
+    dataset = dataset.prefetch(max(capacity // batch_size, 1))
+
+    image_batch, label_batch = dataset.make_one_shot_iterator().get_next()
+    image_batch = batch_standardization(image_batch)
+
+    return image_batch, label_batch
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Input queues with a shared, adaptive thread budget.
+
+tf.train.batch(num_threads=64) starts 64 enqueue threads for every pipeline,
+a train and a val pipeline are already 128 decode threads fighting the
+training step for the cores. batch here builds the same queue as
+tf.train.batch / tf.train.shuffle_batch, but all pipelines of the process
+share one CPUBudget. Every pipeline starts with one active enqueue thread, and
+a tuner thread looks at all queues every INTERVAL seconds:
+    - a queue below LOW_WATER means the step waits for input, the pipeline
+      gets one more thread while the budget has one left
+    - a queue above HIGH_WATER gives one thread back to the budget, a queue
+      that one thread keeps above HIGH_WATER has more buffer than it needs,
+      its buffer (max_fill) shrinks by BUFFER_STEP and the decoded images
+      beyond it are no longer held in memory
+    - a queue below LOW_WATER also gets its buffer back by BUFFER_STEP, up
+      to the capacity, to absorb the bursts of the step
+    - the step time is measured from the batches taken out of the queues, if
+      it gets worse than its moving average after threads were added (the
+      decoders slow down the step), they are taken back and the budget
+      stays below that level. After RECOVER_ROUNDS rounds without that the
+      ceiling goes up by one again, a noisy reading does not shrink the
+      budget for the rest of the run
+The capacity of a TF queue is fixed when the graph is built, the buffer size
+is the max_fill below it up to which the enqueue threads fill the queue.
+
+The pipelines are registered as queue runners, tf.train.start_queue_runners
+starts their threads and the tuner as usual. Every graph has its own budget,
+the pipelines of a graph that was thrown away are not counted in the next one.
+
+Shared by the experiment directories, which put '../common' on sys.path.
+
+@author: zhong
+"""
+
+import threading
+import time
+import weakref
+import tensorflow as tf
+from multiprocessing import cpu_count
+
+# the fill level counts only what is above min_after_dequeue, a shuffle queue
+# can not be dequeued below it and sits there when it is starved
+LOW_WATER = 0.2    # fill level below which a pipeline gets one more thread
+HIGH_WATER = 0.8   # fill level above which it gives one back
+BUFFER_STEP = 0.25 # part of the capacity the buffer of a queue shrinks or grows by
+INTERVAL = 2.0     # seconds between two tuning rounds
+SMOOTHING = 0.3    # weight of the newest step time in its moving average
+RECOVER_ROUNDS = 15  # stable rounds after which a lowered ceiling is probed one thread higher
+
+#%%
+class CPUBudget(object):
+    '''number of enqueue threads all pipelines may run at the same time
+    '''
+
+    def __init__(self, num_threads=None, fixed=False):
+        '''
+        Args:
+            num_threads: the budget, default is half of the cpu cores, the
+                         other half is left to the training step
+            fixed: every pipeline runs num_threads threads from the start and
+                   no tuner runs, e.g. to measure a given thread count
+        '''
+        self.num_threads = num_threads or max(cpu_count() // 2, 1)
+        self.fixed = fixed
+        self.ceiling = self.num_threads
+        self.pipelines = []
+        self.added = []
+        self.smoothed_step_time = None
+        self.stable_rounds = 0
+        self.lock = threading.Lock()
+
+    def used(self):
+        return sum(p.limit for p in self.pipelines)
+
+    def tune(self, sess):
+        '''one tuning round over all pipelines of the budget'''
+        stats = [(p.fill(sess), p.step_time(sess), p) for p in self.pipelines]
+        # the queue taken from most often is the one of the training step
+        times = [t for _, t, _ in stats if t is not None]
+        step_time = min(times) if times else None
+        with self.lock:
+            if self.added and step_time is not None and self.smoothed_step_time is not None \
+                    and step_time > 1.05 * self.smoothed_step_time:
+                # more decode threads made the step slower, undo and stay below
+                for p in self.added:
+                    p.set_limit(p.limit - 1)
+                self.ceiling = self.used()
+                self.added = []
+                self.stable_rounds = 0
+                return
+            if step_time is not None:
+                self.smoothed_step_time = step_time if self.smoothed_step_time is None else \
+                    SMOOTHING * step_time + (1 - SMOOTHING) * self.smoothed_step_time
+            self.added = []
+            self.stable_rounds += 1
+            if self.ceiling < self.num_threads and self.stable_rounds >= RECOVER_ROUNDS:
+                # the slow step may have been noise, probe one thread higher again
+                self.ceiling += 1
+                self.stable_rounds = 0
+            # give back first, so the threads can go to a starving pipeline in the same round
+            for fill, _, p in stats:
+                if fill > HIGH_WATER:
+                    if p.limit > 1:
+                        p.set_limit(p.limit - 1)
+                    else:
+                        p.resize_buffer(-1)
+            for fill, _, p in sorted(stats, key=lambda x: x[0]):
+                if fill < LOW_WATER:
+                    p.resize_buffer(1)
+                    if self.used() < self.ceiling:
+                        p.set_limit(p.limit + 1)
+                        self.added.append(p)
+
+
+# graph: its budget, a budget goes away with its graph
+_budgets = weakref.WeakKeyDictionary()
+
+def default_budget():
+    '''the budget shared by the pipelines of the default graph that do not get their own'''
+    graph = tf.get_default_graph()
+    if graph not in _budgets:
+        _budgets[graph] = CPUBudget()
+    return _budgets[graph]
+
+
+def set_budget(num_threads, fixed=False):
+    '''size of the shared budget of the default graph, call it before its pipelines are built'''
+    budget = CPUBudget(num_threads, fixed)
+    _budgets[tf.get_default_graph()] = budget
+    return budget
+
+#%%
+class AdaptiveQueueRunner(object):
+    '''fills one queue with up to budget.num_threads threads, of which only
+    limit run an enqueue at the same time, the others wait in Python and cost
+    no cpu. Has the create_threads of tf.train.QueueRunner, so it is started
+    by tf.train.start_queue_runners.
+    '''
+
+    def __init__(self, queue, enqueue_op, capacity, batch_size, budget, min_after_dequeue=0):
+        self.queue = queue
+        self.enqueue_op = enqueue_op
+        self.size_op = queue.size()
+        self.close_op = queue.close()
+        self.cancel_op = queue.close(cancel_pending_enqueues=True)
+        self.capacity = capacity
+        self.min_after_dequeue = min_after_dequeue
+        self.batch_size = batch_size
+        self.budget = budget
+        self.limit = budget.num_threads if budget.fixed else 1
+        # buffer size, the queue is filled up to max_fill elements, never below
+        # what a shuffle queue needs plus two batches
+        self.max_fill = capacity
+        self.min_fill = min(min_after_dequeue + 2 * batch_size, capacity)
+        self.active = 0
+        self.enqueued = 0
+        self.running = 0
+        self.last_taken = (0, time.time())
+        self.cond = threading.Condition()
+        budget.pipelines.append(self)
+
+    def fill(self, sess):
+        '''fraction of the dequeueable part of the buffer, max_fill - min_after_dequeue, that is filled'''
+        size = sess.run(self.size_op) - self.min_after_dequeue
+        return max(float(size), 0.0) / (self.max_fill - self.min_after_dequeue)
+
+    def resize_buffer(self, direction):
+        '''grow (1) or shrink (-1) max_fill by BUFFER_STEP of the capacity, between min_fill and capacity'''
+        step = max(int(BUFFER_STEP * self.capacity), 1)
+        self.max_fill = min(max(self.max_fill + direction * step, self.min_fill), self.capacity)
+
+    def step_time(self, sess):
+        '''seconds per batch taken out of the queue since the last call, None if none was taken'''
+        with self.cond:
+            enqueued = self.enqueued
+        taken, now = enqueued - int(sess.run(self.size_op)), time.time()
+        last_taken, last_time = self.last_taken
+        self.last_taken = (taken, now)
+        batches = float(taken - last_taken) / self.batch_size
+        return (now - last_time) / batches if batches >= 1 else None
+
+    def set_limit(self, limit):
+        with self.cond:
+            self.limit = limit
+            self.cond.notify_all()
+
+    def _run(self, sess, coord):
+        while not coord.should_stop():
+            if self.max_fill < self.capacity:
+                # the buffer is kept below the capacity, wait until the step took some
+                try:
+                    size = sess.run(self.size_op)
+                except Exception:
+                    break
+                if size >= self.max_fill:
+                    coord.wait_for_stop(0.01)
+                    continue
+            with self.cond:
+                while self.active >= self.limit and not coord.should_stop():
+                    self.cond.wait(0.1)
+                if coord.should_stop():
+                    break
+                self.active += 1
+            try:
+                sess.run(self.enqueue_op)
+                with self.cond:
+                    self.enqueued += 1
+            except (tf.errors.OutOfRangeError, tf.errors.CancelledError):
+                break
+            except Exception as e:
+                coord.request_stop(e)
+                break
+            finally:
+                with self.cond:
+                    self.active -= 1
+                    self.cond.notify()
+        with self.cond:
+            self.running -= 1
+            last = self.running == 0
+        if last:
+            # the input is exhausted, the rest of the queue can still be dequeued
+            try:
+                sess.run(self.close_op)
+            except Exception:
+                pass
+
+    def _close_on_stop(self, sess, coord):
+        coord.wait_for_stop()
+        try:
+            sess.run(self.cancel_op)
+        except Exception:
+            pass
+
+    def create_threads(self, sess, coord=None, daemon=False, start=False):
+        if coord is None:
+            coord = tf.train.Coordinator()
+        self.running = self.budget.num_threads
+        threads = [threading.Thread(target=self._run, args=(sess, coord))
+                   for _ in range(self.running)]
+        threads.append(threading.Thread(target=self._close_on_stop, args=(sess, coord)))
+        # the first pipeline of a budget also starts its tuner
+        if self.budget.pipelines[0] is self and not self.budget.fixed:
+            threads.append(threading.Thread(target=_tune, args=(self.budget, sess, coord)))
+        for t in threads:
+            coord.register_thread(t)
+            t.daemon = daemon
+            if start:
+                t.start()
+        return threads
+
+
+def _tune(budget, sess, coord):
+    while not coord.wait_for_stop(INTERVAL):
+        try:
+            budget.tune(sess)
+        except Exception:
+            # the session is closing
+            return
+
+#%%
+def batch(tensors, batch_size, capacity, min_after_dequeue=None, budget=None, name=None):
+    '''tf.train.batch / tf.train.shuffle_batch with threads from a shared budget
+    Args:
+        tensors: list of tensors of one sample, e.g. [image, label]
+        batch_size: batch size
+        capacity: the maximum elements in queue
+        min_after_dequeue: None for a FIFO queue, else a shuffle queue like shuffle_batch
+        budget: CPUBudget, default is default_budget()
+    Returns:
+        list of batched tensors
+    '''
+    budget = budget or default_budget()
+    with tf.name_scope(name, 'adaptive_batch', tensors):
+        dtypes = [t.dtype for t in tensors]
+        shapes = [t.get_shape() for t in tensors]
+        if min_after_dequeue is None:
+            queue = tf.FIFOQueue(capacity, dtypes, shapes)
+        else:
+            queue = tf.RandomShuffleQueue(capacity, min_after_dequeue, dtypes, shapes)
+        runner = AdaptiveQueueRunner(queue, queue.enqueue(tensors), capacity, batch_size, budget,
+                                     min_after_dequeue or 0)
+        tf.train.add_queue_runner(runner)
+        tf.summary.scalar('fraction_of_%d_full' % capacity,
+                          tf.cast(runner.size_op, tf.float32) * (1.0 / capacity))
+        return queue.dequeue_many(batch_size)
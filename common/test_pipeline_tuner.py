@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of pipeline_tuner, run with: python test_pipeline_tuner.py
+
+@author: zhong
+"""
+
+import tensorflow as tf
+import pipeline_tuner
+
+
+class FakePipeline(object):
+    '''fill and step time set by the test, no queue'''
+
+    def __init__(self, budget):
+        self.limit = 1
+        self.fill_level = 0.0
+        self.seconds = None
+        budget.pipelines.append(self)
+
+    def fill(self, sess):
+        return self.fill_level
+
+    def step_time(self, sess):
+        return self.seconds
+
+    def set_limit(self, limit):
+        self.limit = limit
+
+    def resize_buffer(self, direction):
+        pass
+
+
+class PipelineTunerTest(tf.test.TestCase):
+
+    def _runner(self, capacity, min_after_dequeue=None, num_threads=4):
+        budget = pipeline_tuner.CPUBudget(num_threads)
+        pipeline_tuner.batch([tf.constant(1.0)], 10, capacity, min_after_dequeue, budget=budget)
+        return budget, budget.pipelines[0]
+
+    def _enqueue(self, sess, runner, n):
+        for _ in range(n):
+            sess.run(runner.enqueue_op)
+
+    def testStarvedShuffleQueueRamps(self):
+        with tf.Graph().as_default(), self.test_session() as sess:
+            # like cifar10_input: min_after_dequeue is 3/4 of the capacity
+            budget, runner = self._runner(100, 75)
+            self._enqueue(sess, runner, 75)
+            self.assertAlmostEqual(runner.fill(sess), 0.0)
+            budget.tune(sess)
+            self.assertEqual(runner.limit, 2)
+
+    def testFullShuffleQueueGivesBack(self):
+        with tf.Graph().as_default(), self.test_session() as sess:
+            budget, runner = self._runner(100, 75)
+            runner.set_limit(2)
+            self._enqueue(sess, runner, 98)
+            self.assertAlmostEqual(runner.fill(sess), 23.0 / 25)
+            budget.tune(sess)
+            self.assertEqual(runner.limit, 1)
+
+    def testFifoQueueFill(self):
+        with tf.Graph().as_default(), self.test_session() as sess:
+            budget, runner = self._runner(100)
+            self._enqueue(sess, runner, 50)
+            self.assertAlmostEqual(runner.fill(sess), 0.5)
+            budget.tune(sess)
+            self.assertEqual(runner.limit, 1)
+
+    def testBufferShrinksAndGrows(self):
+        with tf.Graph().as_default(), self.test_session() as sess:
+            budget, runner = self._runner(100)
+            # one thread keeps the queue full, the buffer shrinks
+            self._enqueue(sess, runner, 90)
+            budget.tune(sess)
+            self.assertEqual(runner.limit, 1)
+            self.assertEqual(runner.max_fill, 75)
+            budget.tune(sess)
+            self.assertEqual(runner.max_fill, 50)
+            # never below two batches
+            budget.tune(sess)
+            budget.tune(sess)
+            self.assertEqual(runner.max_fill, 20)
+            # the step drains it, the buffer comes back with a thread
+            sess.run(runner.queue.dequeue_many(88))
+            budget.tune(sess)
+            self.assertEqual(runner.max_fill, 45)
+            self.assertEqual(runner.limit, 2)
+
+    def testCeilingRecovers(self):
+        budget = pipeline_tuner.CPUBudget(4)
+        p = FakePipeline(budget)
+        p.seconds = 1.0
+        budget.tune(None)
+        self.assertEqual(p.limit, 2)
+        # one noisy step after the thread was added, it is taken back
+        p.seconds = 1.2
+        budget.tune(None)
+        self.assertEqual(p.limit, 1)
+        self.assertEqual(budget.ceiling, 1)
+        # the ceiling is probed one higher again after RECOVER_ROUNDS stable rounds
+        p.seconds = 1.0
+        p.fill_level = 0.5
+        for _ in range(pipeline_tuner.RECOVER_ROUNDS):
+            budget.tune(None)
+        self.assertEqual(budget.ceiling, 2)
+        p.fill_level = 0.0
+        budget.tune(None)
+        self.assertEqual(p.limit, 2)
+
+    def testBudgetPerGraph(self):
+        with tf.Graph().as_default():
+            first = pipeline_tuner.default_budget()
+            pipeline_tuner.batch([tf.constant(1.0)], 4, 16)
+            self.assertIs(pipeline_tuner.default_budget(), first)
+            self.assertEqual(len(first.pipelines), 1)
+        with tf.Graph().as_default():
+            second = pipeline_tuner.default_budget()
+            # a new graph does not append to the budget of the old one
+            self.assertIsNot(second, first)
+            self.assertEqual(second.pipelines, [])
+            self.assertEqual(second.used(), 0)
+
+    def testFixedBudget(self):
+        with tf.Graph().as_default():
+            budget = pipeline_tuner.set_budget(3, fixed=True)
+            pipeline_tuner.batch([tf.constant(1.0)], 4, 16)
+            self.assertEqual(budget.pipelines[0].limit, 3)
+            self.assertEqual(budget.used(), 3)
+
+    def testSetBudget(self):
+        with tf.Graph().as_default():
+            budget = pipeline_tuner.set_budget(3)
+            pipeline_tuner.batch([tf.constant(1.0)], 4, 16)
+            self.assertIs(pipeline_tuner.default_budget(), budget)
+            self.assertEqual(budget.num_threads, 3)
+            self.assertEqual(len(budget.pipelines), 1)
+
+
+if __name__ == '__main__':
+    tf.test.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared training loop of the experiment directories.
+
+The scripts add this directory to sys.path and import it flat, like their own
+modules. The input batches are wired straight into the model graph with
+placeholder_with_default, so a training step is a single sess.run and the
+batch never makes the numpy round-trip through feed_dict. Summaries are
+fetched in the same sess.run as train_op, and loss/accuracy are averaged
+in-graph between two logging steps.
+
+@author: zhong
+"""
+
+import os
+import numpy as np
+import tensorflow as tf
+
+#%%
+def input_placeholder(batch, name=None):
+    '''placeholder_with_default over an input batch tensor
+    Args:
+        batch: input tensor of the pipeline, e.g. image_batch or label_batch
+        name: name of the placeholder
+    Returns:
+        tensor with an open batch dimension. If nothing is fed the model reads
+        the batch from the input pipeline, feeding it (e.g. one image for
+        inference, or a val batch) still works like a normal placeholder.
+    '''
+    shape = [None] + batch.get_shape().as_list()[1:]
+    return tf.placeholder_with_default(batch, shape=shape, name=name)
+
+#%%
+def average_metrics(tensors, name='train_average'):
+    '''in-graph running mean of scalar tensors between two logging steps
+    Args:
+        tensors: dict {name: scalar tensor}, e.g. {'loss': loss, 'accuracy': acc}
+        name: scope of the metric variables and summaries
+    Returns:
+        update_ops: run them with every training step
+        summary_op: summary of the averaged values (includes the update)
+        reset_op: restart the averages, run it after each logging step
+    '''
+    with tf.variable_scope(name) as scope:
+        update_ops = []
+        summaries = []
+        for key in sorted(tensors):
+            _, update = tf.metrics.mean(tensors[key], name=key)
+            update_ops.append(update)
+            # collections=[], keep them out of tf.summary.merge_all()
+            summaries.append(tf.summary.scalar(key, update, collections=[]))
+        reset_op = tf.variables_initializer(
+                tf.get_collection(tf.GraphKeys.LOCAL_VARIABLES, scope=scope.name))
+    return update_ops, tf.summary.merge(summaries), reset_op
+
+#%%
+def run_training(sess, train_op, loss, acc, max_step, model_dir, saver,
+                 val_inputs=None, train_feed=None, val_feed=None,
+                 summary_op=None, train_writer=None, val_writer=None,
+                 test_op=None, num_test_batches=0):
+    '''start the queue runners and run the training steps
+    Args:
+        sess: session, variables already initialized
+        train_op, loss, acc: tensors of the model
+        max_step: number of training steps
+        model_dir: the directory to save checkpoints
+        saver: tf.train.Saver
+        val_inputs: dict {input_placeholder: val tensor}, the val batch is fed
+                    into the placeholders every 200 steps
+        train_feed: extra feed_dict for training steps, e.g. {keep_prob: 0.5}
+        val_feed: extra feed_dict for val steps, e.g. {keep_prob: 1.0}
+        summary_op: merged summary op, fetched with train_op every 50 steps
+        train_writer, val_writer: tf.summary.FileWriter
+        test_op: e.g. tf.nn.in_top_k(logits, labels, 1), after the last step
+                 it is run over num_test_batches val batches and the precision
+                 is printed
+    '''
+    train_feed = train_feed or {}
+    val_feed = val_feed or {}
+
+    update_ops, average_summary_op, reset_op = average_metrics({'loss': loss, 'accuracy': acc})
+    sess.run(reset_op)
+
+    coord = tf.train.Coordinator()
+    threads = tf.train.start_queue_runners(sess=sess, coord=coord)
+
+    try:
+        for step in np.arange(max_step):
+            if coord.should_stop():
+                break
+
+            if step % 50 == 0:
+                # one forward pass: the summaries belong to the step that was trained
+                fetches = [train_op, loss, acc, update_ops, average_summary_op]
+                if summary_op is not None:
+                    fetches.append(summary_op)
+                results = sess.run(fetches, feed_dict=train_feed)
+                tra_loss, tra_acc = results[1], results[2]
+                print('Step %d, train loss = %.4f, train accuracy = %.2f%%' % (step, tra_loss, tra_acc))
+                if train_writer is not None:
+                    train_writer.add_summary(results[4], step)
+                    if summary_op is not None:
+                        train_writer.add_summary(results[5], step)
+                sess.run(reset_op)
+            else:
+                sess.run([train_op, update_ops], feed_dict=train_feed)
+
+            if val_inputs is not None and (step % 200 == 0 or (step + 1) == max_step):
+                placeholders = list(val_inputs.keys())
+                val_values = sess.run([val_inputs[p] for p in placeholders])
+                feed_dict = dict(zip(placeholders, val_values))
+                feed_dict.update(val_feed)
+                if summary_op is not None:
+                    val_loss, val_acc, summary_str = sess.run([loss, acc, summary_op], feed_dict=feed_dict)
+                    if val_writer is not None:
+                        val_writer.add_summary(summary_str, step)
+                else:
+                    val_loss, val_acc = sess.run([loss, acc], feed_dict=feed_dict)
+
+                print('**  Step %d, val loss = %.4f, val accuracy = %.2f%%  **' % (step, val_loss, val_acc))
+
+            if step % 2000 == 0 or (step + 1) == max_step:
+                checkpoint_path = os.path.join(model_dir, 'model.ckpt')
+                saver.save(sess, checkpoint_path, global_step=step)
+
+        if test_op is not None:
+            print('----------------')
+            print('Testing Now!')
+            true_count = 0
+            total_sample_count = 0
+            placeholders = list(val_inputs.keys())
+            for _ in range(num_test_batches):
+                if coord.should_stop():
+                    break
+                val_values = sess.run([val_inputs[p] for p in placeholders])
+                feed_dict = dict(zip(placeholders, val_values))
+                feed_dict.update(val_feed)
+                predictions = sess.run(test_op, feed_dict=feed_dict)
+                true_count += np.sum(predictions)
+                total_sample_count += len(predictions)
+            precision = true_count / max(total_sample_count, 1) * 100.0
+            print('precision = %.2f%% of %d examples' % (precision, total_sample_count))
+
+    except tf.errors.OutOfRangeError:
+        print('Done training -- epoch limit reached')
+    finally:
+        coord.request_stop()
+    coord.join(threads)
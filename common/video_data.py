@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Frames straight from the videos.
+
+Instead of a tree with one JPEG per frame, the original videos
+'./data/KTH/<action>/<video>.avi' are decoded by a pool of processes, one
+video per task, keeping every frame_step-th frame. get_video_batch gives the
+same (image_batch, label_batch, num) as input_data.get_batch, so the frame
+extraction step and its millions of small files are not needed.
+
+Shared by CNN and LSTM, the experiment directory puts '../common' on sys.path.
+
+@author: zhong
+"""
+
+import os
+import threading
+import numpy as np
+import cv2
+import tensorflow as tf
+from multiprocessing import Pool, cpu_count
+from image_utils import batch_standardization
+from augment import augment_batch
+
+VIDEO_EXTS = ('.avi', '.mp4', '.mpg')
+
+#%%
+def get_video_txt(video_dir):
+    '''"video label" of every video of video_dir/<action>/, the actions are sorted'''
+    video_label_list = []
+    for class_num, action in enumerate(sorted(os.listdir(video_dir))):
+        action_dir = os.path.join(video_dir, action)
+        for video in sorted(os.listdir(action_dir)):
+            if os.path.splitext(video)[1].lower() in VIDEO_EXTS:
+                video_label_list.append(os.path.join(action_dir, video) + ' ' + str(class_num))
+    np.random.shuffle(video_label_list)
+    return video_label_list
+
+
+def generate_video_txt(video_dir, ratio, trainFile='./train_avi.txt', testFile='./val_avi.txt'):
+    '''split the videos into a train and a val list'''
+    video_label = get_video_txt(video_dir)
+    n_train = int(len(video_label) * ratio)
+    for file, lines in ((trainFile, video_label[:n_train]), (testFile, video_label[n_train:])):
+        with open(file, 'w') as f:
+            for line in lines:
+                f.write(line + '\n')
+
+    print('Successfully generated video txt file')
+    print('Trainging videos: %d' % n_train)
+    print('Testing videos: %d' % (len(video_label) - n_train))
+
+
+def read_video_txt(file):
+    videos = []
+    labels = []
+    with open(file, 'r') as file_to_read:
+        for line in file_to_read.readlines():
+            tmp = line.strip('\n').split(' ')
+            videos.append(tmp[0])
+            labels.append(int(tmp[-1]))
+    return videos, labels
+
+
+def count_frames(video, frame_step=1):
+    '''number of frames decode_video returns, from the container header'''
+    capture = cv2.VideoCapture(video)
+    num = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    return (num + frame_step - 1) // frame_step
+
+#%%
+def decode_video(args):
+    '''decode one video
+    Args:
+        args: (video, image_W, image_H, frame_step, channels)
+    Returns:
+        uint8 array [num_frames, image_W, image_H, channels], RGB or grayscale,
+        every frame_step-th frame
+    '''
+    video, image_W, image_H, frame_step, channels = args
+    capture = cv2.VideoCapture(video)
+    if not capture.isOpened():
+        raise IOError('Could not open: %s' % video)
+    frames = []
+    index = 0
+    # grab() skips a frame without decoding it, only the sampled frames are retrieved
+    while capture.grab():
+        if index % frame_step == 0:
+            ok, frame = capture.retrieve()
+            if not ok:
+                break
+            if channels == 1:
+                # to gray before the resize, a third of the pixels to resize
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            # cv2 size is (columns, rows), like resize_images(image, [image_W, image_H])
+            frame = cv2.resize(frame, (image_H, image_W), interpolation=cv2.INTER_LINEAR)
+            frames.append(frame[:, :, np.newaxis] if channels == 1 else frame[:, :, ::-1])
+        index += 1
+    capture.release()
+    if not frames:
+        return np.empty((0, image_W, image_H, channels), dtype=np.uint8)
+    return np.stack(frames)
+
+
+def get_video_batch(file, image_W, image_H, batch_size, capacity, frame_step=1,
+                    num_workers=None, shuffle=True, channels=3, augment=None, max_in_flight=None):
+    '''(image, label) batches of the frames of the videos in a video txt
+    Args:
+        file: txt file written by generate_video_txt, 'video label' per line
+        image_W: image width
+        image_H: image height
+        batch_size: batch size
+        capacity: number of frames to shuffle over
+        frame_step: keep every frame_step-th frame, e.g. 5 for 5 fps of a 25 fps video
+        num_workers: number of decode processes, default is the number of cpu cores
+        shuffle: shuffle the videos every epoch and the frames in the buffer
+        channels: 3, or 1 for grayscale batches like LSTM/input_data.get_batch
+        augment: None, or a policy dict of augment.augment_batch
+        max_in_flight: number of videos decoded or waiting to be read at the
+                       same time, default 2 * num_workers
+    Returns:
+        image_batch: 4D tensor [batch_size, width, height, channels], dtype=tf.float32
+        label_batch: 1D tensor [batch_size], dtype=tf.int64
+        number of frames per epoch
+    '''
+    videos, labels = read_video_txt(file)
+    num = sum(count_frames(video, frame_step) for video in videos)
+
+    num_workers = num_workers or cpu_count()
+    # forked here, while the graph is built: forking from the generator thread
+    # of a running session copies the locks held by the other TF threads
+    pool = Pool(processes=num_workers)
+    in_flight = threading.BoundedSemaphore(max_in_flight or 2 * num_workers)
+
+    def jobs(order):
+        for i in order:
+            # the pool takes a new video only when one was read, the decoded
+            # frames of a whole epoch never pile up in memory
+            in_flight.acquire()
+            yield videos[i], image_W, image_H, frame_step, channels
+
+    def generate_frames():
+        while True:
+            order = np.random.permutation(len(videos)) if shuffle else np.arange(len(videos))
+            # the videos are decoded in parallel, in order, so the labels stay with the frames
+            for i, frames in zip(order, pool.imap(decode_video, jobs(order))):
+                in_flight.release()
+                for frame in frames:
+                    yield frame, labels[i]
+
+    dataset = tf.data.Dataset.from_generator(generate_frames,
+                                             (tf.uint8, tf.int64),
+                                             ([image_W, image_H, channels], []))
+    if shuffle:
+        # the frames of a video come out together, the buffer mixes the videos
+        dataset = dataset.shuffle(capacity)
+    dataset = dataset.apply(tf.contrib.data.batch_and_drop_remainder(batch_size))
+    dataset = dataset.prefetch(2)
+    image_batch, label_batch = dataset.make_one_shot_iterator().get_next()
+
+    if augment is not None:
+        image_batch = augment_batch(image_batch, augment)
+    image_batch = batch_standardization(image_batch)
+
+    return image_batch, label_batch, num
@@ -3,7 +3,27 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 
-def get_batch(file, image_h, image_w, batch_size, capacity=256):
+def decode_and_crop_or_pad(image_contents, target_height, target_width, channels=3):
+    '''same as decode_jpeg + resize_image_with_crop_or_pad, but only the centre
+    crop window is decoded, the window is computed from the JPEG header
+    '''
+    shape = tf.image.extract_jpeg_shape(image_contents)
+    crop_height = tf.minimum(shape[0], target_height)
+    crop_width = tf.minimum(shape[1], target_width)
+    crop_window = tf.stack([(shape[0] - crop_height) // 2, (shape[1] - crop_width) // 2,
+                            crop_height, crop_width])
+    image = tf.image.decode_and_crop_jpeg(image_contents, crop_window, channels=channels)
+    # only pads now, if the image is smaller than the target
+    return tf.image.resize_image_with_crop_or_pad(image, target_height, target_width)
+
+
+def get_batch(file, image_h, image_w, batch_size, capacity=256, num_threads=16):
+    '''按列表顺序生成 (image, label) batch
+    Args:
+        file: 'image label' 列表
+        capacity: 预取的样本数
+        num_threads: 并行解码的线程数, 不影响输出顺序
+    '''
 
     img_label = []
     with open(file, 'r') as file_to_read:
@@ -16,32 +36,29 @@ def get_batch(file, image_h, image_w, batch_size, capacity=256):
         label = img_label[:, -1]
         label = np.int32(label)
 
-    image = tf.cast(image, tf.string)
-    label = tf.cast(label, tf.int64)
-
-    # 创建文件名队列
-    input_queue = tf.train.slice_input_producer([image, label], shuffle=False)
-
-    # 从文件名队列读取数据到内存队列中
-    label = input_queue[1]
-    image_contents = tf.read_file(input_queue[0])
-    image = tf.image.decode_jpeg(image_contents, channels=3)
-    image = tf.image.convert_image_dtype(image, dtype=tf.float32)
-
-    ######################################
-    # data argumentation should go to here
-    ######################################
-
-    image = tf.image.resize_image_with_crop_or_pad(image, image_h, image_w)
-    # image = tf.image.resize_images(image, [image_h, image_w], method=0)
-    # image = tf.image.per_image_standardization(image)
-
-    image_batch, label_batch = tf.train.batch([image, label],
-                                              batch_size=batch_size,
-                                              num_threads=2,  # 设置线程数，设置大了读的数据乱了，我也不知道为什么.....
-                                              capacity=capacity)  # 队列里存放的最大样本数
-
-    label_batch = tf.reshape(label_batch, [batch_size])
+    def decode(image_dir, label):
+        image_contents = tf.read_file(image_dir)
+        # 只解码中心裁剪区域, 不够大时再填充
+        image = decode_and_crop_or_pad(image_contents, image_h, image_w)
+        image = tf.image.convert_image_dtype(image, dtype=tf.float32)
+
+        ######################################
+        # data argumentation should go to here
+        ######################################
+
+        # image = tf.image.resize_images(image, [image_h, image_w], method=0)
+        # image = tf.image.per_image_standardization(image)
+        return image, label
+
+    # 以前 tf.train.batch 的多个线程各自出队, 线程一多顺序就乱了.
+    # map 的并行解码按序号把结果放回原位, 输出顺序和列表一致, 线程数可以随便设
+    dataset = tf.data.Dataset.from_tensor_slices((image, np.int64(label)))
+    dataset = dataset.map(decode, num_parallel_calls=num_threads)
+    dataset = dataset.repeat()
+    dataset = dataset.apply(tf.contrib.data.batch_and_drop_remainder(batch_size))
+    dataset = dataset.prefetch(max(capacity // batch_size, 1))  # 队列里存放的最大样本数
+
+    image_batch, label_batch = dataset.make_one_shot_iterator().get_next()
     # image_batch = tf.cast(image_batch, tf.float32)
 
     return image_batch, label_batch
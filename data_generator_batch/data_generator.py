@@ -8,8 +8,13 @@ Created on Mon Jun 25 16:30:03 2018
 
 """Containes a helper class for image input pipelines in tensorflow."""
 
+import os
+import sys
 import tensorflow as tf
 import numpy as np
+import pickle
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from augment import augment_batch
 
 from tensorflow.contrib.data import Dataset
 from tensorflow.python.framework import dtypes
@@ -18,13 +23,21 @@ from tensorflow.python.framework.ops import convert_to_tensor
 IMAGENET_MEAN = tf.constant([130.90926, 130.90979, 130.90901], dtype=tf.float32)
 
 
+def load_mean(mean_file):
+    """Load the per-channel mean written by data_mean.py as a tf constant."""
+    with open(mean_file, 'rb') as f:
+        stats = pickle.load(f)
+    mean = [stats['channel0'], stats['channel1'], stats['channel2']]
+    return tf.constant(mean, dtype=tf.float32)
+
+
 class ImageDataGenerator(object):
     """Wrapper class around the new Tensorflows dataset pipeline.
     Requires Tensorflow >= version 1.12rc0
     """
 
     def __init__(self, txt_file, mode, batch_size, num_classes, shuffle=True,
-                 buffer_size=1000):
+                 buffer_size=1000, mean_file=None, augment=None, num_threads=8):
         """Create a new ImageDataGenerator.
         Recieves a path string to a text file, which consists of many lines,
         where each line has first a path string to an image and seperated by
@@ -41,11 +54,19 @@ class ImageDataGenerator(object):
                 initial file list.
             buffer_size: Number of images used as buffer for TensorFlows
                 shuffling of the dataset.
+            mean_file: Pickle written by data_mean.py. The per-channel mean
+                of the dataset is subtracted instead of IMAGENET_MEAN.
+            augment: Policy dict of augment.augment_batch, or None. In
+                'training' mode the random crop/flip/brightness/contrast is
+                applied to the whole batch after batching.
+            num_threads: Number of images decoded in parallel.
         Raises:
             ValueError: If an invalid mode is passed.
         """
         self.txt_file = txt_file
         self.num_classes = num_classes
+        self.mean = IMAGENET_MEAN if mean_file is None else load_mean(mean_file)
+        self.augment = augment if mode == 'training' else None
 
         # retrieve the data from the text file
         self._read_txt_file()
@@ -65,12 +86,16 @@ class ImageDataGenerator(object):
         data = Dataset.from_tensor_slices((self.img_paths, self.labels))
 
         # distinguish between train/infer. when calling the parsing functions
-        if mode == 'training':
-            data = data.map(self._parse_function_train, num_threads=8,
+        if mode == 'training' and self.augment is not None:
+            data = data.map(self._parse_function_decode, num_threads=num_threads,
+                      output_buffer_size=100*batch_size)
+
+        elif mode == 'training':
+            data = data.map(self._parse_function_train, num_threads=num_threads,
                       output_buffer_size=100*batch_size)
 
         elif mode == 'inference':
-            data = data.map(self._parse_function_inference, num_threads=8,
+            data = data.map(self._parse_function_inference, num_threads=num_threads,
                       output_buffer_size=100*batch_size)
 
         else:
@@ -83,6 +108,10 @@ class ImageDataGenerator(object):
         # create a new dataset with batches of images
         data = data.batch(batch_size)
 
+        # augment, center and convert the whole batch at once
+        if self.augment is not None:
+            data = data.map(self._augment_batch)
+
         self.data = data
 
     def _read_txt_file(self):
@@ -117,15 +146,10 @@ class ImageDataGenerator(object):
         img_decoded = tf.image.decode_png(img_string, channels=3)
         img_resized = tf.image.resize_images(img_decoded, [60, 80])
         """
-        Data augmentation comes here.
+        Data augmentation is done per batch, see _augment_batch.
         """
 
-#        image = tf.random_crop(img_resized, [24, 24, 3])# randomly crop the image size to 24 x 24
-#        image = tf.image.random_flip_left_right(img_resized)
-#        image = tf.image.random_brightness(image, max_delta=63)
-#        image = tf.image.random_contrast(image,lower=0.2,upper=1.8)
-        
-        img_centered = tf.subtract(img_resized, IMAGENET_MEAN)
+        img_centered = tf.subtract(img_resized, self.mean)
 
         # RGB -> BGR
         img_bgr = img_centered[:, :, ::-1]
@@ -141,9 +165,32 @@ class ImageDataGenerator(object):
         img_string = tf.read_file(filename)
         img_decoded = tf.image.decode_png(img_string, channels=3)
         img_resized = tf.image.resize_images(img_decoded, [60, 80])
-        img_centered = tf.subtract(img_resized, IMAGENET_MEAN)
+        img_centered = tf.subtract(img_resized, self.mean)
 
         # RGB -> BGR
         img_bgr = img_centered[:, :, ::-1]
 
         return img_bgr, one_hot
+
+    def _parse_function_decode(self, filename, label):
+        """Input parser for the training set when augment is set, the images
+        stay unnormalized until _augment_batch."""
+        # convert label number into one-hot-encoding
+        one_hot = tf.one_hot(label, self.num_classes)
+
+        # load and resize the image
+        img_string = tf.read_file(filename)
+        img_decoded = tf.image.decode_png(img_string, channels=3)
+        img_resized = tf.image.resize_images(img_decoded, [60, 80])
+
+        return img_resized, one_hot
+
+    def _augment_batch(self, img_batch, one_hot_batch):
+        """Augmentation of a whole training batch, then centering and BGR."""
+        img_augmented = augment_batch(img_batch, self.augment)
+        img_centered = tf.subtract(img_augmented, self.mean)
+
+        # RGB -> BGR
+        img_bgr = img_centered[:, :, :, ::-1]
+
+        return img_bgr, one_hot_batch
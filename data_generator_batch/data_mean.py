@@ -1,47 +1,84 @@
 import numpy as np
 import pickle
 import matplotlib.image as mpimg
+from multiprocessing import Pool, cpu_count
 
 from scipy.misc.pilutil import imresize
 
 
 txt_file = './train.txt'
+mean_file = 'mean.pkl'
+CHUNK_SIZE = 1000
 
 
-print('Generating mean file...')
-    
-frames_channel0 = []
-frames_channel1 = []
-frames_channel2 = []
-with open(txt_file, 'r') as f:
-    lines = f.readlines()
-    for line in lines:
-        items = line.split(' ')
-        img_paths = items[0]
-        frame = mpimg.imread(img_paths)
+def channel_stats(img_paths):
+    '''sum, sum of squares and pixel count per channel over a chunk of images
+    Only one frame is held in memory at a time, the sums are float64.
+    '''
+    channel_sum = np.zeros(3, dtype=np.float64)
+    channel_sq_sum = np.zeros(3, dtype=np.float64)
+    num_pixels = 0
+    for img_path in img_paths:
+        frame = mpimg.imread(img_path)
         frame = imresize(frame, (60, 80, 3))
-        
-        frame_channel0 = frame[:,:,0]
-        frame_channel1 = frame[:,:,1]
-        frame_channel2 = frame[:,:,2]
-
-        frames_channel0.append(frame_channel0)
-        frames_channel1.append(frame_channel1)
-        frames_channel2.append(frame_channel2)
-
-frames_channel0 = np.array(frames_channel0, dtype=np.float32)
-frames_channel1 = np.array(frames_channel1, dtype=np.float32)
-frames_channel2 = np.array(frames_channel2, dtype=np.float32)
-
-mean_channel0 = np.mean(frames_channel0)
-mean_channel1 = np.mean(frames_channel1)
-mean_channel2 = np.mean(frames_channel2)
-     
-pickle.dump({'channel0':mean_channel0, 
-             'channel1':mean_channel1, 
-             'channel2':mean_channel2},open("mean.pkl", "wb"))
-print('Successful generate mean file.')
-print('channel0: %f' % mean_channel0)
-print('channel1: %f' % mean_channel1)
-print('channel2: %f' % mean_channel2)       
-            
+        pixels = frame.reshape(-1, 3).astype(np.float64)
+        channel_sum += pixels.sum(axis=0)
+        channel_sq_sum += np.einsum('ij,ij->j', pixels, pixels)
+        num_pixels += pixels.shape[0]
+    return channel_sum, channel_sq_sum, num_pixels
+
+
+def read_chunks(txt_file, chunk_size):
+    '''yield the image paths of the txt file chunk by chunk'''
+    chunk = []
+    with open(txt_file, 'r') as f:
+        for line in f:
+            chunk.append(line.split(' ')[0])
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def compute_mean(txt_file, mean_file, num_workers=None, chunk_size=CHUNK_SIZE):
+    '''streaming per-channel mean and std of all images in txt_file
+    Chunks of the list are read in parallel, the running sums are merged as the
+    chunks come back, so the memory does not grow with the dataset.
+    Returns:
+        mean, std: arrays of 3 values, one per channel
+    '''
+    channel_sum = np.zeros(3, dtype=np.float64)
+    channel_sq_sum = np.zeros(3, dtype=np.float64)
+    num_pixels = 0
+
+    pool = Pool(processes=num_workers or cpu_count())
+    try:
+        for chunk_sum, chunk_sq_sum, chunk_pixels in pool.imap_unordered(channel_stats,
+                                                                         read_chunks(txt_file, chunk_size)):
+            channel_sum += chunk_sum
+            channel_sq_sum += chunk_sq_sum
+            num_pixels += chunk_pixels
+    finally:
+        pool.close()
+        pool.join()
+
+    mean = channel_sum / num_pixels
+    std = np.sqrt(np.maximum(channel_sq_sum / num_pixels - np.square(mean), 0.0))
+
+    # channel0/1/2 keep the old format, ImageDataGenerator reads them
+    pickle.dump({'channel0': mean[0],
+                 'channel1': mean[1],
+                 'channel2': mean[2],
+                 'mean': mean,
+                 'std': std,
+                 'num_pixels': num_pixels}, open(mean_file, "wb"))
+    return mean, std
+
+
+if __name__ == '__main__':
+    print('Generating mean file...')
+    mean, std = compute_mean(txt_file, mean_file)
+    print('Successful generate mean file.')
+    for c in range(3):
+        print('channel%d: mean %f, std %f' % (c, mean[c], std[c]))
@@ -6,6 +6,7 @@ Created on Mon Jun 25 16:30:03 2018
 @author: zhong
 """
 
+import sys
 import os
 
 import numpy as np
@@ -15,6 +16,8 @@ from alexnet import AlexNet
 from datagenerator import ImageDataGenerator
 from datetime import datetime
 from tensorflow.contrib.data import Iterator
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import train_loop
 
 """
 Configuration Part.
@@ -67,9 +70,10 @@ with tf.device('/cpu:0'):
 training_init_op = iterator.make_initializer(tr_data.data)
 validation_init_op = iterator.make_initializer(val_data.data)
 
-# TF placeholder for graph input and output
-x = tf.placeholder(tf.float32, [batch_size, img_h, img_w, 3])
-y = tf.placeholder(tf.float32, [batch_size, num_classes])
+# TF placeholder for graph input and output, by default the batch of the
+# iterator goes straight into the model, feeding x and y still works
+x = tf.placeholder_with_default(next_batch[0], [None, img_h, img_w, 3])
+y = tf.placeholder_with_default(next_batch[1], [None, num_classes])
 keep_prob = tf.placeholder(tf.float32)
 
 # Initialize model
@@ -101,6 +105,9 @@ tf.summary.scalar('accuracy', accuracy)
 # Merge all summaries together
 merged_summary = tf.summary.merge_all()
 
+# in-graph mean of the accuracy over the validation set, kept out of merged_summary
+val_update, val_summary, val_reset = train_loop.average_metrics({'accuracy': accuracy}, name='val_average')
+
 # Initialize the FileWriter
 writer = tf.summary.FileWriter(filewriter_path)
 
@@ -134,36 +141,24 @@ with tf.Session() as sess:
 
         for step in range(train_batches_per_epoch):
 
-            # get next batch of data
-            img_batch, label_batch = sess.run(next_batch)
-
-            # And run the training op
-            _, tra_loss, tra_acc = sess.run([train_op, loss, accuracy], 
-                                            feed_dict={x: img_batch, y: label_batch, keep_prob: dropout_rate})
-
-            # Generate summary with the current batch of data and write to file
+            # run the training op on the next batch of the iterator, the
+            # summary of the same batch is fetched in the same run
             if step % display_step == 0:
+                _, tra_loss, tra_acc, s = sess.run([train_op, loss, accuracy, merged_summary],
+                                                   feed_dict={keep_prob: dropout_rate})
                 print('epoch %d, step %d, train loss = %.4f, train accuracy = %.2f%%' % (epoch+1, step, tra_loss, tra_acc*100.0))
-                s = sess.run(merged_summary, feed_dict={x: img_batch,
-                                                        y: label_batch,
-                                                        keep_prob: 1.})
-
                 writer.add_summary(s, epoch*train_batches_per_epoch + step)
+            else:
+                sess.run(train_op, feed_dict={keep_prob: dropout_rate})
 
         # Validate the model on the entire validation set
         print("{} Start validation".format(datetime.now()))
-        sess.run(validation_init_op)
-        test_acc = 0.
-        test_count = 0
+        sess.run([validation_init_op, val_reset])
         for _ in range(val_batches_per_epoch):
 
-            img_batch, label_batch = sess.run(next_batch)
-            acc = sess.run(accuracy, feed_dict={x: img_batch,
-                                                y: label_batch,
-                                                keep_prob: 1.})
-            test_acc += acc
-            test_count += 1
-        test_acc /= test_count
+            # the update returns the mean of the batches so far
+            test_acc, s = sess.run(val_update + [val_summary], feed_dict={keep_prob: 1.})
+        writer.add_summary(s, (epoch+1)*train_batches_per_epoch)
         print("{} Validation Accuracy = {:.2f}%".format(datetime.now(),
                                                        test_acc*100.0))
         print("{} Saving checkpoint of model...".format(datetime.now()))
@@ -24,7 +24,7 @@ def evaluate_running():
   
     with tf.Graph().as_default():
         
-        val_batch, val_label_batch, n_test = input_data.get_batch(val_txt, IMG_W, IMG_H, BATCH_SIZE, CAPACITY)
+        val_batch, val_label_batch, n_test = input_data.get_batch(val_txt, IMG_W, IMG_H, BATCH_SIZE, CAPACITY, shuffle=False)
         x = tf.placeholder(tf.float32, shape=[BATCH_SIZE, IMG_W, IMG_H, 3])
         y_ = tf.placeholder(tf.int32, shape=[BATCH_SIZE])
         
@@ -27,17 +27,71 @@ model_dir = './model/KTH_RGB6000/'
 if not os.path.exists('./features'):
     os.mkdir('./features')
 
-def fc_feature_extract(txtfile, istrainFile=True):
+def open_feature_store(name, shape, dtype, store):
+    '''preallocate the array the features are written into
+    Args:
+        name: e.g. 'train_features'
+        shape: full shape, [n_samples, feature_dim...]
+        store: 'mat', an array in memory, saved with sio.savemat at the end
+               'npy', a np.memmap backed './features/name.npy', written batch by batch
+    '''
+    if store == 'mat':
+        return np.empty(shape, dtype=dtype)
+    elif store == 'npy':
+        return np.lib.format.open_memmap('./features/' + name + '.npy', mode='w+', dtype=dtype, shape=tuple(shape))
+    else:
+        raise ValueError("Invalid store '%s'." % store)
+
+
+def close_feature_store(name, array, key, store):
+    '''write the array of open_feature_store to './features/name.mat' or flush the memmap'''
+    if store == 'mat':
+        sio.savemat('./features/' + name + '.mat', {key: array})
+    else:
+        array.flush()
+
+
+def layer_feature(model, layer, pooling=None):
+    '''tensor of a named layer of models.model
+    Args:
+        layer: name of a models.model attribute, e.g. 'conv1', 'conv2', 'fc3'
+        pooling: None, keep conv maps as they are
+                 'avg' or 'max', reduce conv maps [batch, h, w, c] to [batch, c]
+                 in-graph by global pooling before they are copied to host
+    '''
+    if not hasattr(model, layer):
+        raise ValueError("models.model has no layer '%s'." % layer)
+    feature = getattr(model, layer)
+    if feature.get_shape().ndims == 4 and pooling is not None:
+        if pooling == 'avg':
+            feature = tf.reduce_mean(feature, axis=[1, 2], name=layer + '_avg_pool')
+        elif pooling == 'max':
+            feature = tf.reduce_max(feature, axis=[1, 2], name=layer + '_max_pool')
+        else:
+            raise ValueError("Invalid pooling '%s'." % pooling)
+    return feature
+
+
+def multi_feature_extract(txtfile, istrainFile=True, layers=('fc3',), pooling=None, store='mat', names=None):
+    '''run the model once over txtfile and save the outputs of several layers
+    Every layer is written to its own store './features/<train|val>_<layer>_features',
+    the labels to './features/<train|val>_labels'.
+    Args:
+        txtfile: txt list, e.g. 'train.txt'
+        istrainFile: write train_*, else val_*
+        layers: names of models.model attributes, e.g. ('conv1', 'conv2', 'fc1', 'fc2', 'fc3')
+        pooling: None, 'avg' or 'max', see layer_feature
+        store: 'mat' or 'npy', see open_feature_store
+        names: optional dict {layer: store name} to override the default names
+    '''
   
     with tf.Graph().as_default():
 
-        batch, label_batch, n = input_data.get_batch(txtfile, IMG_W, IMG_H, BATCH_SIZE, CAPACITY)
-        
-        x = tf.placeholder(tf.float32, shape=[BATCH_SIZE, IMG_W, IMG_H, 3])
+        batch, label_batch, n = input_data.get_batch(txtfile, IMG_W, IMG_H, BATCH_SIZE, CAPACITY, shuffle=False)
         
-        model = models.model(x, N_CLASSES)  
+        model = models.model(batch, N_CLASSES)  
         model.AlexNet()                             #### notice
-        feature = model.fc3
+        features = [layer_feature(model, layer, pooling) for layer in layers]
     
         saver = tf.train.Saver(tf.global_variables())
         
@@ -56,6 +110,14 @@ def fc_feature_extract(txtfile, istrainFile=True):
             coord = tf.train.Coordinator()
             threads = tf.train.start_queue_runners(sess=sess, coord=coord)
             
+            prefix = 'train' if istrainFile else 'val'
+            store_names = [prefix + '_' + layer + '_features' for layer in layers]
+            if names is not None:
+                store_names = [names.get(layer, name) for layer, name in zip(layers, store_names)]
+            all_features = [open_feature_store(name, [n] + feature.get_shape().as_list()[1:], np.float32, store)
+                            for name, feature in zip(store_names, features)]
+            all_labels = open_feature_store(prefix + '_labels', [n], np.int32, store)
+            
             try:
                 
                 num_iter = int(math.ceil(n / BATCH_SIZE))
@@ -63,38 +125,22 @@ def fc_feature_extract(txtfile, istrainFile=True):
                 
                 while step < num_iter and not coord.should_stop():
                     
-                    images, labels = sess.run([batch, label_batch])    
-                    
-                    if step == 0 :
-                        all_features = sess.run([feature],feed_dict={x:images})
-                        all_features = np.array(all_features)
-                        all_features = np.squeeze(all_features)
-                        
-                        all_labels = labels
-                        pass
+                    # one forward pass for all layers
+                    results = sess.run(features + [label_batch])
                     
-                    feature_map = sess.run([feature],feed_dict={x:images})
-                    feature_map = np.array(feature_map)
-                    feature_map = np.squeeze(feature_map)
-#                    dic_feature = {'features':feature_map}
-#                    sio.savemat('./features/'+str(step)+'.mat',dic_feature)
-                    all_features = np.concatenate((all_features, feature_map),axis=0)
-                    all_labels = np.concatenate((all_labels, labels),axis=0)
+                    # the last batch wraps around into the next epoch, keep only the first n samples
+                    start = step * BATCH_SIZE
+                    size = min(BATCH_SIZE, n - start)
+                    for store_array, feature_map in zip(all_features, results[:-1]):
+                        store_array[start:start + size] = feature_map[:size]
+                    all_labels[start:start + size] = results[-1][:size]
 
                     step = step+1
                 
-                if istrainFile==True:
-                    dic_feature = {'features': all_features}
-                    sio.savemat('./features/'+'train_features.mat', dic_feature)
-                    dic_label = {'labels': all_labels}
-                    sio.savemat('./features/'+'train_labels.mat', dic_label)
-                    print('\nSuccessfully generated train matfile\n')
-                else:
-                    dic_feature = {'features': all_features}
-                    sio.savemat('./features/' + 'val_features.mat', dic_feature)
-                    dic_label = {'labels': all_labels}
-                    sio.savemat('./features/' + 'val_labels.mat', dic_label)
-                    print('\nSuccessfully generated val matfile\n')
+                for name, store_array in zip(store_names, all_features):
+                    close_feature_store(name, store_array, 'features', store)
+                close_feature_store(prefix + '_labels', all_labels, 'labels', store)
+                print('\nSuccessfully generated %s features of %s\n' % (prefix, ', '.join(layers)))
                         
             except Exception as e:
                 coord.request_stop(e)
@@ -102,11 +148,19 @@ def fc_feature_extract(txtfile, istrainFile=True):
                 coord.request_stop()
             coord.join(threads)
 
+
+def fc_feature_extract(txtfile, istrainFile=True, layer='fc3', store='mat'):
+    '''save the output of one layer as train_features/val_features, the files load_feature.py reads
+    '''
+    prefix = 'train' if istrainFile else 'val'
+    multi_feature_extract(txtfile, istrainFile, layers=(layer,), store=store,
+                          names={layer: prefix + '_features'})
+
 def conv_feature_extract(txtfile):
   
     with tf.Graph().as_default():
 
-        batch, label_batch, n = input_data.get_batch(txtfile, IMG_W, IMG_H, BATCH_SIZE, CAPACITY)
+        batch, label_batch, n = input_data.get_batch(txtfile, IMG_W, IMG_H, BATCH_SIZE, CAPACITY, shuffle=False)
         
         x = tf.placeholder(tf.float32, shape=[BATCH_SIZE, IMG_W, IMG_H, 3])
         
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Classifier heads for the features written by extract_feature.py.
+
+'svc' is the kernel SVC load_feature.py used to run, O(n^2)-O(n^3) and the
+whole matrix in memory, it does not finish on every extracted frame and is
+only trained if it is asked for, e.g. heads=('svc',) + HEADS on a subsample.
+The heads of HEADS are trained with mini-batch partial_fit over the feature
+store, so every extracted frame can be used:
+    'linear_svm'  SGD with hinge loss
+    'logistic'    SGD logistic regression
+    'rff'         random Fourier features (RBFSampler) + linear SVM
+    'nystroem'    Nystroem kernel approximation + linear SVM
+
+@author: zhong
+"""
+
+import os
+import numpy as np
+import scipy.io as sio
+from sklearn import svm
+from sklearn import metrics
+from sklearn.linear_model import SGDClassifier
+from sklearn.kernel_approximation import RBFSampler, Nystroem
+from sklearn.preprocessing import StandardScaler
+from datetime import datetime
+
+HEADS = ('linear_svm', 'logistic', 'rff', 'nystroem')
+
+#%%
+def load_features(name, key, feature_dir='./features/'):
+    '''load a feature store of extract_feature.py
+    Args:
+        name: e.g. 'train_features'
+        key: key of the .mat file, 'features' or 'labels'
+    Returns:
+        './features/name.npy' opened as memmap if it exists, else the array of './features/name.mat'
+    '''
+    npy_file = os.path.join(feature_dir, name + '.npy')
+    if os.path.exists(npy_file):
+        return np.load(npy_file, mmap_mode='r')
+    return np.array(sio.loadmat(os.path.join(feature_dir, name + '.mat'))[key])
+
+
+def chunks(n, chunk_size, rng=None):
+    '''slices of [0, n), in random order if rng is given'''
+    starts = np.arange(0, n, chunk_size)
+    if rng is not None:
+        rng.shuffle(starts)
+    for start in starts:
+        yield slice(start, min(start + chunk_size, n))
+
+
+def flat(x):
+    return np.asarray(x, dtype=np.float64).reshape(len(x), -1)
+
+#%%
+class FeatureHead(object):
+    '''standardisation + optional kernel approximation + linear classifier,
+    trained chunk by chunk over a (memmapped) feature array.
+    '''
+
+    def __init__(self, head='linear_svm', n_components=1000, gamma=None,
+                 epochs=5, chunk_size=10000, seed=0):
+        '''
+        Args:
+            head: one of HEADS, or 'svc'
+            n_components: dimension of the kernel approximation ('rff', 'nystroem')
+            gamma: RBF kernel width, default 1 / n_features like svm.SVC
+            epochs: passes over the data of the SGD heads
+            chunk_size: number of samples in memory at a time
+            seed: random seed
+        '''
+        if head != 'svc' and head not in HEADS:
+            raise ValueError("Invalid head '%s'." % head)
+        self.head = head
+        self.n_components = n_components
+        self.gamma = gamma
+        self.epochs = epochs
+        self.chunk_size = chunk_size
+        self.rng = np.random.RandomState(seed)
+        self.seed = seed
+        self.scaler = StandardScaler()
+        self.kernel_map = None
+
+    def _transform(self, x):
+        x = self.scaler.transform(flat(x))
+        if self.kernel_map is not None:
+            x = self.kernel_map.transform(x)
+        return x
+
+    def fit(self, features, labels):
+        n = len(labels)
+        labels = np.asarray(labels).ravel()
+
+        # the kernel SVC needs the whole matrix in memory
+        if self.head == 'svc':
+            x = self.scaler.fit_transform(flat(features))
+            self.clf = svm.SVC()
+            self.clf.fit(x, labels)
+            return self
+
+        for s in chunks(n, self.chunk_size):
+            self.scaler.partial_fit(flat(features[s]))
+
+        gamma = self.gamma if self.gamma is not None else 1.0 / flat(features[:1]).shape[1]
+        if self.head == 'rff':
+            self.kernel_map = RBFSampler(gamma=gamma, n_components=self.n_components, random_state=self.seed)
+            self.kernel_map.fit(self.scaler.transform(flat(features[:1])))
+        elif self.head == 'nystroem':
+            index = np.sort(self.rng.choice(n, min(self.n_components, n), replace=False))
+            self.kernel_map = Nystroem(gamma=gamma, n_components=len(index), random_state=self.seed)
+            self.kernel_map.fit(self.scaler.transform(flat(features[index])))
+
+        loss = 'log' if self.head == 'logistic' else 'hinge'
+        self.clf = SGDClassifier(loss=loss, alpha=1e-4, random_state=self.seed)
+        classes = np.unique(labels)
+        for epoch in range(self.epochs):
+            for s in chunks(n, self.chunk_size, self.rng):
+                self.clf.partial_fit(self._transform(features[s]), labels[s], classes=classes)
+        return self
+
+    def predict(self, features):
+        if self.head == 'svc':
+            return self.clf.predict(self.scaler.transform(flat(features)))
+        return np.concatenate([self.clf.predict(self._transform(features[s]))
+                               for s in chunks(len(features), self.chunk_size)])
+
+#%%
+def evaluate_heads(train_feature, train_label, val_feature, val_label, heads=HEADS, **kwargs):
+    '''train every head, report fit time, predict time and val accuracy
+    Args:
+        kwargs: passed to FeatureHead
+    Returns:
+        dict {head: (accuracy, fit seconds, predict seconds)}
+    '''
+    val_label = np.asarray(val_label).ravel()
+    results = {}
+    for head in heads:
+        start_time = datetime.now()
+        clf = FeatureHead(head, **kwargs).fit(train_feature, train_label)
+        fit_time = (datetime.now() - start_time).total_seconds()
+
+        start_time = datetime.now()
+        val_predict = clf.predict(val_feature)
+        predict_time = (datetime.now() - start_time).total_seconds()
+
+        accuarcy = metrics.accuracy_score(val_predict, val_label)
+        results[head] = (accuarcy, fit_time, predict_time)
+        print('%-10s Accuarcy: %.2f%%  fit: %.1fs  predict: %.1fs' % (head, accuarcy*100.0, fit_time, predict_time))
+    return results
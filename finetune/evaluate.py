@@ -31,7 +31,7 @@ def evaluate_running():
         test_dir = './data/'
         n_test = 10000
                 
-        images, labels = input_data.read_cifar10(data_dir=test_dir,
+        images, labels = input_data.read_cifar10_in_memory(data_dir=test_dir,
                                                     is_train=False,
                                                     batch_size= BATCH_SIZE,
                                                     shuffle=False)
@@ -6,13 +6,18 @@ Created on Tue Apr  3 15:22:21 2018
 @author: zhong
 """
 
+import sys
 import tensorflow as tf
 import numpy as np
 import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from augment import augment_batch
+import pipeline_tuner
+from image_utils import batch_standardization
 
 #%% Reading data
 
-def read_cifar10(data_dir, is_train, batch_size, shuffle):
+def read_cifar10(data_dir, is_train, batch_size, shuffle, augment=None):
     """Read CIFAR10
     
     Args:
@@ -20,6 +25,8 @@ def read_cifar10(data_dir, is_train, batch_size, shuffle):
         is_train: boolen
         batch_size:
         shuffle:       
+        augment: None, or a policy dict of augment.augment_batch, applied to
+                 the whole uint8 batch before the standardization
     Returns:
         label: 1D tensor, tf.int32
         image: 4D tensor, [batch_size, height, width, 3], tf.float32
@@ -54,34 +61,24 @@ def read_cifar10(data_dir, is_train, batch_size, shuffle):
         image_raw = tf.slice(record_bytes, [label_bytes], [image_bytes])     
         image_raw = tf.reshape(image_raw, [img_depth, img_height, img_width])     
         image = tf.transpose(image_raw, (1,2,0)) # convert from D/H/W to H/W/D       
-        image = tf.cast(image, tf.float32)
 
      
 #        # data argumentation
-
-#        image = tf.random_crop(image, [24, 24, 3])# randomly crop the image size to 24 x 24
-#        image = tf.image.random_flip_left_right(image)
-#        image = tf.image.random_brightness(image, max_delta=63)
-#        image = tf.image.random_contrast(image,lower=0.2,upper=1.8)
+#        done on the whole batch after dequeue with augment.augment_batch, e.g.
+#        augment={'crop': [24, 24], 'flip': True, 'brightness': 63, 'contrast': [0.2, 1.8]}
 
 
         
-        image = tf.image.per_image_standardization(image) #substract off the mean and divide by the variance 
+        # keep uint8 in the queue, the whole batch is standardized after dequeue
 
 
         if shuffle:
-            images, label_batch = tf.train.shuffle_batch(
-                                    [image, label], 
-                                    batch_size = batch_size,
-                                    num_threads= 64,
-                                    capacity = 20000,
-                                    min_after_dequeue = 3000)
+            images, label_batch = pipeline_tuner.batch([image, label], batch_size, 20000, min_after_dequeue=3000)
         else:
-            images, label_batch = tf.train.batch(
-                                    [image, label],
-                                    batch_size = batch_size,
-                                    num_threads = 64,
-                                    capacity= 2000)
+            images, label_batch = pipeline_tuner.batch([image, label], batch_size, 2000)
+        if augment is not None:
+            images = augment_batch(images, augment)
+        images = batch_standardization(images)  #substract off the mean and divide by the variance 
         ## ONE-HOT      
         n_classes = 10
         label_batch = tf.one_hot(label_batch, depth= n_classes)
@@ -89,4 +86,89 @@ def read_cifar10(data_dir, is_train, batch_size, shuffle):
         label_batch = tf.reshape(label_batch, [batch_size, n_classes])
         
         return images, label_batch
+
+
+#%% In-memory reading
+
+def load_cifar10(data_dir, is_train):
+    """Read the CIFAR10 binary batches once into memory
+
+    Args:
+        data_dir: the directory of CIFAR10
+        is_train: boolen, read data_batch_1..5 or test_batch
+    Returns:
+        images: uint8 array, [N, height, width, 3]
+        labels: int32 array, [N]
+    """
+    img_width = 32
+    img_height = 32
+    img_depth = 3
+    label_bytes = 1
+    image_bytes = img_width*img_height*img_depth
+
+    if is_train:
+        filenames = [os.path.join(data_dir, 'data_batch_%d.bin' %ii)
+                                    for ii in np.arange(1, 6)]
+    else:
+        filenames = [os.path.join(data_dir, 'test_batch.bin')]
+
+    records = np.concatenate([np.fromfile(f, dtype=np.uint8) for f in filenames])
+    records = records.reshape(-1, label_bytes + image_bytes)
+
+    labels = records[:, 0].astype(np.int32)
+    # convert all records from D/H/W to H/W/D at once
+    images = records[:, label_bytes:].reshape(-1, img_depth, img_height, img_width)
+    images = np.ascontiguousarray(images.transpose(0, 2, 3, 1))
+
+    return images, labels
+
+
+def read_cifar10_in_memory(data_dir, is_train, batch_size, shuffle, seed=None, augment=None):
+    """Read CIFAR10 from an in-memory uint8 array instead of the reader queue
+
+    The dataset is loaded once by load_cifar10, every batch is gathered from
+    the array by index (a new permutation every epoch if shuffle), so no
+    queue-runner threads are needed.
+    Args:
+        data_dir: the directory of CIFAR10
+        is_train: boolen
+        batch_size:
+        shuffle:
+        seed: seed of the permutations
+        augment: None, or a policy dict of augment.augment_batch, applied to
+                 the whole uint8 batch before the standardization
+    Returns:
+        same as read_cifar10
+    """
+    images, labels = load_cifar10(data_dir, is_train)
+    n_samples = len(labels)
+
+    def generate_batches():
+        rng = np.random.RandomState(seed)
+        while True:
+            order = rng.permutation(n_samples) if shuffle else np.arange(n_samples)
+            for start in range(0, n_samples - batch_size + 1, batch_size):
+                index = order[start:start + batch_size]
+                yield images[index], labels[index]
+
+    with tf.name_scope('input'):
+
+        dataset = tf.data.Dataset.from_generator(generate_batches,
+                                                 (tf.uint8, tf.int32),
+                                                 ([batch_size, 32, 32, 3], [batch_size]))
+        dataset = dataset.prefetch(2)
+        image_batch, label_batch = dataset.make_one_shot_iterator().get_next()
+
+        if augment is not None:
+            image_batch = augment_batch(image_batch, augment)
+        image_batch = batch_standardization(image_batch)
+
+        ## ONE-HOT
+        n_classes = 10
+        label_batch = tf.one_hot(label_batch, depth= n_classes)
+        label_batch = tf.cast(label_batch, dtype=tf.int32)
+        label_batch = tf.reshape(label_batch, [batch_size, n_classes])
+
+        return image_batch, label_batch
+
 #%%
\ No newline at end of file
@@ -6,6 +6,7 @@ Created on Tue Apr  3 15:25:37 2018
 @author: zhong
 """
     
+import sys
 import os
 import os.path
 
@@ -15,6 +16,8 @@ import tensorflow as tf
 import input_data
 import VGG
 import tools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import train_loop
 
 IMG_W = 32
 IMG_H = 32
@@ -33,22 +36,26 @@ def train_running():
     val_log_dir = './logs/val/'
     
     with tf.name_scope('input'):
-        tra_image_batch, tra_label_batch = input_data.read_cifar10(data_dir=data_dir,
+        tra_image_batch, tra_label_batch = input_data.read_cifar10_in_memory(data_dir=data_dir,
                                                  is_train=True,
                                                  batch_size= BATCH_SIZE,
                                                  shuffle=True)
-        val_image_batch, val_label_batch = input_data.read_cifar10(data_dir=data_dir,
+        val_image_batch, val_label_batch = input_data.read_cifar10_in_memory(data_dir=data_dir,
                                                  is_train=False,
                                                  batch_size= BATCH_SIZE,
                                                  shuffle=False)
         
-    x = tf.placeholder(tf.float32, shape=[BATCH_SIZE, IMG_W, IMG_H, 3])
-    y_ = tf.placeholder(tf.int16, shape=[BATCH_SIZE, N_CLASSES]) 
+    # the train batch goes straight into the model, val batches are fed
+    x = tf.placeholder_with_default(tra_image_batch, shape=[BATCH_SIZE, IMG_W, IMG_H, 3])
+    y_ = tf.placeholder_with_default(tf.cast(tra_label_batch, tf.int16), shape=[BATCH_SIZE, N_CLASSES]) 
     
     logits = VGG.VGG16N(x, N_CLASSES, IS_PRETRAIN)
     loss = tools.loss(logits, y_)
     accuracy = tools.accuracy(logits, y_)
     train_op = tools.optimize(loss, learning_rate)   
+    # sorted by name: [accuracy, loss], the summary includes the update
+    val_update, val_summary_op, val_reset = train_loop.average_metrics({'loss': loss, 'accuracy': accuracy},
+                                                                       name='val_average')
     
     saver = tf.train.Saver(tf.global_variables())
     summary_op = tf.summary.merge_all()   
@@ -71,19 +78,19 @@ def train_running():
             if coord.should_stop():
                     break
                 
-            tra_images,tra_labels = sess.run([tra_image_batch, tra_label_batch])
-            _, tra_loss, tra_acc = sess.run([train_op, loss, accuracy],feed_dict={x:tra_images, y_:tra_labels})   
-            
             if step % 50 == 0 or (step + 1) == MAX_STEP:                 
+                _, tra_loss, tra_acc, summary_str = sess.run([train_op, loss, accuracy, summary_op])
                 print ('Step: %d, loss: %.4f, accuracy: %.4f%%' % (step, tra_loss, tra_acc))
-                summary_str = sess.run(summary_op, feed_dict={x:tra_images, y_:tra_labels})
                 tra_summary_writer.add_summary(summary_str, step)
+            else:
+                sess.run(train_op)
                 
             if step % 200 == 0 or (step + 1) == MAX_STEP:
                 val_images, val_labels = sess.run([val_image_batch, val_label_batch])
-                val_loss, val_acc = sess.run([loss, accuracy],feed_dict={x:val_images,y_:val_labels})
+                sess.run(val_reset)
+                val_acc, val_loss, summary_str = sess.run(val_update + [val_summary_op],
+                                                          feed_dict={x:val_images,y_:val_labels})
                 print('**  Step %d, val loss = %.4f, val accuracy = %.4f%%  **' %(step, val_loss, val_acc))
-                summary_str = sess.run(summary_op, feed_dict={x:val_images,y_:val_labels})
                 val_summary_writer.add_summary(summary_str, step)
                     
             if step % 2000 == 0 or (step + 1) == MAX_STEP:
@@ -21,15 +21,17 @@ MIN_AFTER_DEQUENE = 512
 
 data_dir = './data/KTH_RGB/'
 model_dir = './model/KTH_RGB100000_AlexNet_bn/'          #### notice
-val_tfrecords_file ='val.tfrecords'
+val_tfrecords_file ='val-*-of-*.tfrecords'
 
 def evaluate_running():
   
     with tf.Graph().as_default():
         
-        val_batch, val_label_batch = input_data.read_and_decode(val_tfrecords_file, IMG_W, IMG_H, BATCH_SIZE, MIN_AFTER_DEQUENE)
+        val_batch, val_label_batch = input_data.read_and_decode_shards(val_tfrecords_file, IMG_W, IMG_H, BATCH_SIZE, 0,
+                                                                       compression=input_data.record_compression('val'),
+                                                                       encoding=input_data.record_encoding('val'))
 
-        _,_,_,_,n_test = input_data.get_files(data_dir, RATIO, ret_val_num=True)
+        n_test = input_data.num_records('val')
         
         logits = models.AlexNet(val_batch, N_CLASSES)    #### notice
         top_k_op = tf.nn.in_top_k(logits, val_label_batch, 1)
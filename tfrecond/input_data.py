@@ -8,12 +8,20 @@ Created on Thu Mar 29 08:03:17 2018
 
 #%%
 
+import sys
 import tensorflow as tf
 import numpy as np
 import os
 import math
 import cv2
+import json
 from datetime import datetime
+from multiprocessing import Pool, cpu_count
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from augment import augment_batch
+from tfrecord_index import IndexedTFRecords
+import pipeline_tuner
+from image_utils import batch_standardization
 
 #%%
 
@@ -68,14 +76,67 @@ def bytes_feature(value):
   return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
 
 #%%
+ENCODINGS = ('raw', 'jpeg', 'png')
+COMPRESSIONS = (None, 'GZIP', 'ZLIB')
 
-def convert_to_tfrecord(images, labels, name):
+def record_options(compression):
+    '''TFRecordOptions of the writer for compression None, 'GZIP' or 'ZLIB'
+    '''
+    if compression not in COMPRESSIONS:
+        raise ValueError("Invalid compression '%s'." % compression)
+    if compression is None:
+        return None
+    return tf.python_io.TFRecordOptions(getattr(tf.python_io.TFRecordCompressionType, compression))
+
+#%%
+
+def image_to_example(image_dir, label, encoding='raw', quality=95):
+    '''read, resize and serialize one image into an Example proto
+    Args:
+        image_dir: the directory of the image, string type
+        label: label of the image, int type
+        encoding: payload of 'image_raw', 'raw' uint8 pixels, 'jpeg' or 'png'
+        quality: JPEG quality
+    Returns:
+        tf.train.Example, or None if the image can not be read
+    '''
+    image = cv2.imread(image_dir)
+    if image is None:
+        print('Could not read:', image_dir)
+        print('Skip it!\n')
+        return None
+    image = cv2.resize(image, (160,120)) ###
+    if encoding == 'raw':
+        # RGB, like the decoded jpeg/png payloads
+        image_raw = image[:, :, ::-1].tostring()
+    elif encoding == 'jpeg':
+        image_raw = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tostring()
+    elif encoding == 'png':
+        image_raw = cv2.imencode('.png', image)[1].tostring()
+    else:
+        raise ValueError("Invalid encoding '%s'." % encoding)
+    height, width, channels = image.shape
+    example = tf.train.Example(features=tf.train.Features(feature={
+                    'label':int64_feature(int(label)),
+                    'image_raw': bytes_feature(image_raw),
+                    'height': int64_feature(height),
+                    'width': int64_feature(width),
+                    'channels': int64_feature(channels),
+                    'encoding': bytes_feature(encoding.encode('utf-8'))}))
+    return example
+
+#%%
+
+def convert_to_tfrecord(images, labels, name, encoding='raw', quality=95, compression=None):
     '''convert all images and labels to one tfrecord file.
     Args:
         images: list of image directories, string type
         labels: list of labels, int type
         save_dir: the directory to save tfrecord file, e.g.: '/home/folder1/'
         name: the name of tfrecord file, string type, e.g.: 'train'
+        encoding: 'raw', 'jpeg' or 'png', see image_to_example
+        quality: JPEG quality
+        compression: None, 'GZIP' or 'ZLIB' record compression
     Return:
         no return
     Note:
@@ -89,39 +150,214 @@ def convert_to_tfrecord(images, labels, name):
         raise ValueError('Images size %d does not match label size %d.' %(images.shape[0], n_samples))
     
     # wait some time here, transforming need some time based on the size of your data.
-    writer = tf.python_io.TFRecordWriter(filename)
+    writer = tf.python_io.TFRecordWriter(filename, options=record_options(compression))
     print('\nTransform %s data......'%name)
     for i in np.arange(0, n_samples):
-        try:
-            image = cv2.imread(images[i]) 
-            image = cv2.resize(image, (160,120)) ###
-            image_raw = image.tostring()
-            label = int(labels[i])
-            example = tf.train.Example(features=tf.train.Features(feature={
-                            'label':int64_feature(label),
-                            'image_raw': bytes_feature(image_raw)}))
+        example = image_to_example(images[i], labels[i], encoding, quality)
+        if example is not None:
             writer.write(example.SerializeToString())
-        except IOError as e:
-            print('Could not read:', images[i])
-            print('error: %s' %e)
-            print('Skip it!\n')
     writer.close()
     end_time = datetime.now()
     print('Transform %s data done!'%name)
     print((end_time-start_time))
     
     
-#%%    
-def generate_tfrecond(data_dir, ratio):
+#%%
+def shard_name(name, shard, num_shards):
+    '''e.g. shard_name('train', 3, 16) -> 'train-00003-of-00016.tfrecords'
+    '''
+    return '%s-%05d-of-%05d.tfrecords' % (name, shard, num_shards)
+
+
+def _convert_shard(args):
+    '''worker of convert_to_tfrecord_shards, write one shard file
+    Returns:
+        (shard file name, number of records written)
+    '''
+    images, labels, filename, encoding, quality, compression = args
+    writer = tf.python_io.TFRecordWriter(filename, options=record_options(compression))
+    n_records = 0
+    for image_dir, label in zip(images, labels):
+        example = image_to_example(image_dir, label, encoding, quality)
+        if example is not None:
+            writer.write(example.SerializeToString())
+            n_records += 1
+    writer.close()
+    return filename, n_records
+
 
+def convert_to_tfrecord_shards(images, labels, name, num_shards=16, num_workers=None,
+                               encoding='raw', quality=95, compression=None):
+    '''convert all images and labels to num_shards tfrecord files in parallel.
+    Every shard is decoded, resized and written by its own worker process,
+    a manifest 'name-manifest.json' records the number of records per shard.
+    Args:
+        images: list of image directories, string type
+        labels: list of labels, int type
+        name: the prefix of tfrecord files, string type, e.g.: 'train'
+        num_shards: number of output shards
+        num_workers: number of worker processes, default is the number of cpu cores
+        encoding: 'raw', 'jpeg' or 'png', see image_to_example
+        quality: JPEG quality
+        compression: None, 'GZIP' or 'ZLIB' record compression
+    Return:
+        manifest dict
+    '''
+    start_time = datetime.now()
+    n_samples = len(labels)
+    
+    if np.shape(images)[0] != n_samples:
+        raise ValueError('Images size %d does not match label size %d.' %(np.shape(images)[0], n_samples))
+    
+    if num_workers is None:
+        num_workers = cpu_count()
+    
+    # contiguous slices, so that shard i holds samples [bounds[i], bounds[i+1])
+    bounds = np.linspace(0, n_samples, num_shards + 1).astype(np.int64)
+    jobs = [(images[bounds[i]:bounds[i+1]], labels[bounds[i]:bounds[i+1]], shard_name(name, i, num_shards),
+             encoding, quality, compression)
+            for i in range(num_shards)]
+    
+    print('\nTransform %s data into %d shards with %d workers......' %(name, num_shards, num_workers))
+    pool = Pool(processes=min(num_workers, num_shards))
+    try:
+        results = pool.map(_convert_shard, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    
+    manifest = {'name': name,
+                'num_shards': num_shards,
+                'num_records': int(sum(n for _, n in results)),
+                'encoding': encoding,
+                'compression': compression,
+                'shards': [{'file': f, 'num_records': int(n)} for f, n in results]}
+    with open(name + '-manifest.json', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    
+    end_time = datetime.now()
+    print('Transform %s data done! %d records' %(name, manifest['num_records']))
+    print((end_time-start_time))
+    return manifest
+
+def read_manifest(name):
+    '''the manifest written by convert_to_tfrecord_shards
+    '''
+    with open(name + '-manifest.json') as f:
+        return json.load(f)
+
+def num_records(name):
+    '''number of records written by convert_to_tfrecord_shards, read from the manifest
+    '''
+    return read_manifest(name)['num_records']
+
+def record_compression(name):
+    '''record compression of the shards, None for manifests written without it
+    '''
+    return read_manifest(name).get('compression')
+
+def record_encoding(name):
+    '''payload of the shards, 'raw' for manifests written without it
+    '''
+    return read_manifest(name).get('encoding', 'raw')
+
+#%%    
+def generate_tfrecond(data_dir, ratio, num_shards=None, num_workers=None,
+                      encoding='raw', quality=95, compression=None):
+    '''
+    Args:
+        num_shards: if None, write one 'train.tfrecords' and one 'val.tfrecords',
+                    else write num_shards parallel converted shards for each of them
+        encoding: 'raw', 'jpeg' or 'png', see image_to_example
+        quality: JPEG quality
+        compression: None, 'GZIP' or 'ZLIB' record compression
+    '''
     name_train = 'train'
     name_val = 'val'
     tra_images,tra_labels,val_images,val_labels = get_files(data_dir, ratio)
-    convert_to_tfrecord(tra_images, tra_labels, name_train)
-    convert_to_tfrecord(val_images, val_labels, name_val)
+    if num_shards is None:
+        convert_to_tfrecord(tra_images, tra_labels, name_train, encoding, quality, compression)
+        convert_to_tfrecord(val_images, val_labels, name_val, encoding, quality, compression)
+    else:
+        convert_to_tfrecord_shards(tra_images, tra_labels, name_train, num_shards, num_workers,
+                                   encoding, quality, compression)
+        convert_to_tfrecord_shards(val_images, val_labels, name_val, num_shards, num_workers,
+                                   encoding, quality, compression)
+
+#%%
+# features of a record of image_to_example, records written before the shape
+# and the encoding were stored are raw [160, 120, 3]
+RECORD_FEATURES = {
+        'label': tf.FixedLenFeature([], tf.int64),
+        'image_raw': tf.FixedLenFeature([], tf.string),
+        'height': tf.FixedLenFeature([], tf.int64, default_value=160),
+        'width': tf.FixedLenFeature([], tf.int64, default_value=120),
+        'channels': tf.FixedLenFeature([], tf.int64, default_value=3),
+        'encoding': tf.FixedLenFeature([], tf.string, default_value='raw'),
+        }
+
+def decode_image_raw(image_raw, encoding, height, width, channels):
+    '''decode the image of one parsed record
+    Returns:
+        image: 3D uint8 tensor - [height, width, 3]
+    '''
+    image = tf.cond(tf.equal(encoding, 'raw'),
+                    lambda: tf.decode_raw(image_raw, tf.uint8),
+                    lambda: tf.reshape(tf.image.decode_image(image_raw, channels=3), [-1]))
+    shape = tf.cast(tf.stack([height, width, channels]), tf.int32)
+    image = tf.reshape(image, shape)
+    image.set_shape([None, None, 3])
+    return image
+
+
+def decode_example(serialized_example):
+    '''parse one record and decode its image
+    The shape and the encoding are read from the record.
+    Returns:
+        image: 3D uint8 tensor - [height, width, 3]
+        label: int32 scalar
+    '''
+    img_features = tf.parse_single_example(serialized_example, features=RECORD_FEATURES)
+    image = decode_image_raw(img_features['image_raw'], img_features['encoding'],
+                             img_features['height'], img_features['width'], img_features['channels'])
+    label = tf.cast(img_features['label'], tf.int32)
+    return image, label
+
+
+def parse_example_batch(serialized_batch, image_W, image_H, batch_size, encoding=None, parallel_iterations=8):
+    '''parse a whole batch of records with one parse_example and decode the images
+    Args:
+        serialized_batch: 1D string tensor of batch_size records
+        encoding: 'raw' when all records are raw (one decode_raw and reshape for
+                  the batch), else the images are decoded one by one,
+                  parallel_iterations of them at the same time
+    Returns:
+        image: 4D uint8 tensor - [batch_size, image_W, image_H, 3]
+        label: 1D int32 tensor - [batch_size]
+    '''
+    img_features = tf.parse_example(serialized_batch, features=RECORD_FEATURES)
+    if encoding == 'raw':
+        # raw records all have the shape of image_to_example
+        image = tf.decode_raw(img_features['image_raw'], tf.uint8)
+        shape = tf.cast(tf.stack([batch_size, img_features['height'][0], img_features['width'][0],
+                                  img_features['channels'][0]]), tf.int32)
+        image = tf.reshape(image, shape)
+        image.set_shape([batch_size, None, None, 3])
+        image = tf.image.resize_image_with_crop_or_pad(image, image_W, image_H) ###
+    else:
+        def decode(features):
+            image = decode_image_raw(*features)
+            return tf.image.resize_image_with_crop_or_pad(image, image_W, image_H) ###
+        image = tf.map_fn(decode,
+                          (img_features['image_raw'], img_features['encoding'],
+                           img_features['height'], img_features['width'], img_features['channels']),
+                          dtype=tf.uint8, parallel_iterations=parallel_iterations, back_prop=False)
+        image.set_shape([batch_size, image_W, image_H, 3])
+    label = tf.cast(img_features['label'], tf.int32)
+    return image, label
 
 #%%  
-def read_and_decode(tfrecords_file, image_W, image_H, batch_size, min_after_dequeue):
+def read_and_decode(tfrecords_file, image_W, image_H, batch_size, min_after_dequeue, augment=None, compression=None):
     '''read and decode tfrecord file, generate (image, label) batches
     Args:
         tfrecords_file: the directory of tfrecord file
@@ -129,6 +365,9 @@ def read_and_decode(tfrecords_file, image_W, image_H, batch_size, min_after_dequ
         image_H: image height
         batch_size: number of images in each batch
         capacity: the maximum elements in queue
+        augment: None, or a policy dict of augment.augment_batch, applied to
+                 the whole uint8 batch before the standardization
+        compression: None, 'GZIP' or 'ZLIB', as the file was written
     Returns:
         image: 4D tensor - [batch_size, width, height, channel]
         label: 1D tensor - [batch_size]
@@ -136,30 +375,112 @@ def read_and_decode(tfrecords_file, image_W, image_H, batch_size, min_after_dequ
     # make an input queue from the tfrecord file
     filename_queue = tf.train.string_input_producer([tfrecords_file])
     
-    reader = tf.TFRecordReader()
+    reader = tf.TFRecordReader(options=record_options(compression))
     _, serialized_example = reader.read(filename_queue)
-    img_features = tf.parse_single_example(
-                                        serialized_example,
-                                        features={
-                                               'label': tf.FixedLenFeature([], tf.int64),
-                                               'image_raw': tf.FixedLenFeature([], tf.string),
-                                               })
-    image = tf.decode_raw(img_features['image_raw'], tf.uint8)
-    image = tf.reshape(image, [160,120,3]) ####
-    label = tf.cast(img_features['label'], tf.int32)  
+    image, label = decode_example(serialized_example)
     
     ##########################################################
-    # you can put data augmentation here, I didn't use it
+    # data augmentation is done on the whole batch after dequeue, see augment
     ##########################################################
     
     image = tf.image.resize_image_with_crop_or_pad(image, image_W, image_H) ###
-    image = tf.image.per_image_standardization(image)
+    # keep uint8 in the queue, the whole batch is standardized after dequeue
     capacity = 2*min_after_dequeue
-    image_batch, label_batch = tf.train.shuffle_batch([image, label],
-                                                batch_size= batch_size,
-                                                min_after_dequeue= min_after_dequeue, 
-                                                capacity = capacity)
+    image_batch, label_batch = pipeline_tuner.batch([image, label], batch_size, capacity, min_after_dequeue=min_after_dequeue)
     label_batch = tf.reshape(label_batch, [batch_size])
-    image_batch = tf.cast(image_batch, tf.float32)
+    if augment is not None:
+        image_batch = augment_batch(image_batch, augment)
+    image_batch = batch_standardization(image_batch)
+    
+    return image_batch, label_batch
+
+#%%
+def read_and_decode_shards(file_pattern, image_W, image_H, batch_size, shuffle_buffer, num_parallel_reads=8, augment=None,
+                           compression=None, num_parallel_calls=8, encoding=None):
+    '''read tfrecord shards in parallel with tf.data, generate (image, label) batches
+    Args:
+        file_pattern: glob of the shards, e.g.: 'train-*-of-*.tfrecords'
+        image_W: image width
+        image_H: image height
+        batch_size: number of images in each batch
+        shuffle_buffer: number of records to shuffle over, 0 means no shuffle
+        num_parallel_reads: number of shards read at the same time
+        augment: None, or a policy dict of augment.augment_batch, applied to
+                 the whole uint8 batch before the standardization
+        compression: None, 'GZIP' or 'ZLIB', as the shards were written
+        num_parallel_calls: number of batches parsed and of images decoded at the same time
+        encoding: 'raw', 'jpeg' or 'png', as the shards were written (record_encoding),
+                  None reads the encoding of every record
+    Returns:
+        image: 4D tensor - [batch_size, width, height, channel]
+        label: 1D tensor - [batch_size]
+    '''
+    if compression not in COMPRESSIONS:
+        raise ValueError("Invalid compression '%s'." % compression)
+    if encoding is not None and encoding not in ENCODINGS:
+        raise ValueError("Invalid encoding '%s'." % encoding)
+    compression_type = compression or ''
+
+    def read_shard(filename):
+        return tf.data.TFRecordDataset(filename, compression_type=compression_type)
+
+    def parse_batch(serialized_batch):
+        # the features of the whole batch are parsed at once, whatever the encoding
+        return parse_example_batch(serialized_batch, image_W, image_H, batch_size, encoding, num_parallel_calls)
+    
+    files = tf.data.Dataset.list_files(file_pattern)
+    dataset = files.apply(tf.contrib.data.parallel_interleave(read_shard,
+                                                              cycle_length=num_parallel_reads,
+                                                              sloppy=True))
+    if shuffle_buffer > 0:
+        dataset = dataset.shuffle(shuffle_buffer)
+    dataset = dataset.repeat()
+    dataset = dataset.apply(tf.contrib.data.batch_and_drop_remainder(batch_size))
+    dataset = dataset.map(parse_batch, num_parallel_calls=num_parallel_calls)
+    dataset = dataset.prefetch(1)
+    
+    image_batch, label_batch = dataset.make_one_shot_iterator().get_next()
+    if augment is not None:
+        image_batch = augment_batch(image_batch, augment)
+    image_batch = batch_standardization(image_batch)
     
     return image_batch, label_batch
+
+#%%
+def read_and_decode_indexed(file_pattern, image_W, image_H, batch_size, shuffle=True, seed=None,
+                            augment=None, num_parallel_calls=8):
+    '''read uncompressed tfrecord files through their offset index, generate (image, label) batches
+    Every epoch is a new permutation of all records of all files, a global
+    shuffle without a shuffle buffer in memory. The records are sought and
+    read one by one in Python, so this reader is slower than
+    read_and_decode_shards, use it when the mixing matters more than the
+    throughput, and for random access.
+    Args:
+        file_pattern: glob of the files, e.g.: 'train-*-of-*.tfrecords'
+        image_W: image width
+        image_H: image height
+        batch_size: number of images in each batch
+        shuffle: False reads the records in file order
+        seed: seed of the permutations
+        augment: None, or a policy dict of augment.augment_batch
+        num_parallel_calls: number of records decoded at the same time
+    Returns:
+        image: 4D tensor - [batch_size, width, height, channel]
+        label: 1D tensor - [batch_size]
+    '''
+    records = IndexedTFRecords(file_pattern)
+
+    def parse_batch(serialized_batch):
+        return parse_example_batch(serialized_batch, image_W, image_H, batch_size, None, num_parallel_calls)
+
+    dataset = tf.data.Dataset.from_generator(lambda: records.records(shuffle, seed), tf.string, tf.TensorShape([]))
+    dataset = dataset.apply(tf.contrib.data.batch_and_drop_remainder(batch_size))
+    dataset = dataset.map(parse_batch, num_parallel_calls=2)
+    dataset = dataset.prefetch(1)
+
+    image_batch, label_batch = dataset.make_one_shot_iterator().get_next()
+    if augment is not None:
+        image_batch = augment_batch(image_batch, augment)
+    image_batch = batch_standardization(image_batch)
+
+    return image_batch, label_batch
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Byte-offset index of .tfrecords files.
+
+A record of a .tfrecords file is
+    uint64 length | uint32 crc of length | data[length] | uint32 crc of data
+build_index walks the headers once and saves (offset, length) of every record
+to 'file.tfrecords.idx.npy'. IndexedTFRecords then seeks straight to record i,
+so an epoch can be read in a full random permutation over all files instead of
+through a shuffle buffer, and a single sample can be looked up for debugging.
+Only uncompressed files can be indexed, GZIP/ZLIB streams can not be seeked.
+
+@author: zhong
+"""
+
+import os
+import glob
+import struct
+import numpy as np
+
+HEADER_BYTES = 12  # uint64 length + uint32 crc
+FOOTER_BYTES = 4   # uint32 crc
+
+#%%
+def index_name(tfrecords_file):
+    return tfrecords_file + '.idx.npy'
+
+
+def build_index(tfrecords_file):
+    '''scan a tfrecord file and save the offset and length of every record
+    Returns:
+        int64 array [num_records, 2], (offset of the data, length of the data)
+    '''
+    index = []
+    with open(tfrecords_file, 'rb') as f:
+        offset = 0
+        while True:
+            header = f.read(HEADER_BYTES)
+            if not header:
+                break
+            if len(header) != HEADER_BYTES:
+                raise IOError('Truncated record at byte %d of %s' % (offset, tfrecords_file))
+            length = struct.unpack('<Q', header[:8])[0]
+            index.append((offset + HEADER_BYTES, length))
+            offset += HEADER_BYTES + length + FOOTER_BYTES
+            f.seek(offset)
+    index = np.array(index, dtype=np.int64).reshape(-1, 2)
+    np.save(index_name(tfrecords_file), index)
+    return index
+
+
+def load_index(tfrecords_file):
+    '''the index of a tfrecord file, (re)built if it is missing or older than the file'''
+    name = index_name(tfrecords_file)
+    if os.path.exists(name) and os.path.getmtime(name) >= os.path.getmtime(tfrecords_file):
+        return np.load(name)
+    return build_index(tfrecords_file)
+
+#%%
+class IndexedTFRecords(object):
+    '''random access to the records of one or more tfrecord files
+    '''
+
+    def __init__(self, file_pattern):
+        '''
+        Args:
+            file_pattern: glob of the files, e.g. 'train-*-of-*.tfrecords'
+        '''
+        self.files = sorted(glob.glob(file_pattern))
+        if not self.files:
+            raise IOError('No file matches %s' % file_pattern)
+        indexes = [load_index(f) for f in self.files]
+        # record i of the dataset is record local[i] of file file_ids[i]
+        self.file_ids = np.concatenate([np.full(len(index), i, dtype=np.int32) for i, index in enumerate(indexes)])
+        self.index = np.concatenate(indexes)
+        self.handles = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        '''serialized Example of record i'''
+        f = self.handles.get(self.file_ids[i])
+        if f is None:
+            f = self.handles[self.file_ids[i]] = open(self.files[self.file_ids[i]], 'rb')
+        offset, length = self.index[i]
+        f.seek(offset)
+        return f.read(length)
+
+    def records(self, shuffle=True, seed=None, num_epochs=None):
+        '''generate the serialized records, in a new permutation of all records every epoch
+        Args:
+            shuffle: False keeps the file order
+            seed: seed of the permutations
+            num_epochs: None for endless
+        '''
+        rng = np.random.RandomState(seed)
+        epoch = 0
+        while num_epochs is None or epoch < num_epochs:
+            order = rng.permutation(len(self)) if shuffle else np.arange(len(self))
+            for i in order:
+                yield self[i]
+            epoch += 1
+
+    def close(self):
+        for f in self.handles.values():
+            f.close()
+        self.handles = {}
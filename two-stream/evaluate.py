@@ -24,10 +24,10 @@ model_dir = './model/KTH_twostream/'
 def evaluate_running():
   
     with tf.Graph().as_default():
-        val_RGB_batch, val_FLOW_batch, val_label_batch, n_val = input_data.get_batch(val_txt, IMG_W, IMG_H, BATCH_SIZE, CAPACITY)
+        val_RGB_batch, val_FLOW_batch, val_label_batch, n_val = input_data.get_pair_batch(val_txt, IMG_W, IMG_H, BATCH_SIZE, CAPACITY, shuffle=False)
 #        
         x1 = tf.placeholder(tf.float32, shape=[BATCH_SIZE, IMG_W, IMG_H, 3])
-        x2 = tf.placeholder(tf.float32, shape=[BATCH_SIZE, IMG_W, IMG_H, 3])
+        x2 = tf.placeholder(tf.float32, shape=[BATCH_SIZE, IMG_W, IMG_H, val_FLOW_batch.get_shape()[-1].value])
         y_ = tf.placeholder(tf.int32, shape=[BATCH_SIZE])
         logits = models.AlexNet(x1, x2, N_CLASSES)
         top_k_op = tf.nn.in_top_k(logits, y_, 1)
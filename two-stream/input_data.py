@@ -7,20 +7,28 @@ Created on Thu Mar 29 08:03:17 2018
 """
 
 
+import sys
 import tensorflow as tf
 import numpy as np
 import os
-import math
+import hashlib
+import cv2
+from multiprocessing import Pool, cpu_count
+import optical_flow
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import pipeline_tuner
+from image_utils import batch_standardization
 
 
 def getPerActionList(actionPath, isRGB=True):
 
     actionList = []
-    actionNames = os.listdir(actionPath)
+    # the video directories of the RGB and the flow tree in the same order
+    actionNames = sorted(os.listdir(actionPath))
     if len(actionNames) > 0:
         for action in actionNames:
             actionName = os.path.join(actionPath, action)
-            x = os.listdir(actionName)
+            x = sorted(os.listdir(actionName))
             if len(x) > 0:
                 if isRGB:
                     for xt in x[:-1]:
@@ -33,14 +41,32 @@ def getPerActionList(actionPath, isRGB=True):
     return actionList
 
 
+def pairPerVideo(imageRGBList, imageFLOWList):
+    '''pair the RGB frames with the flow files of the same video and frame name
+    The flow of frames i and i+1 is saved under the name of frame i, with the
+    extension of the storage ('.jpg' images or '.flo8'), so a pair is matched
+    by video directory and file name without extension, never by position.
+    '''
+    def key(path):
+        return os.path.basename(os.path.dirname(path)), os.path.splitext(os.path.basename(path))[0]
+
+    flows = dict((key(flow), flow) for flow in imageFLOWList)
+    pairs = []
+    for rgb in imageRGBList:
+        flow = flows.get(key(rgb))
+        if flow is not None:
+            pairs.append((rgb, flow))
+    return pairs
+
+
 def getAllActionList(actionRGBPath, actionFLOWPath, actionNum):
 
     img_label_list = []
     class_num = 0
     for i in actionNum:
         imageRGBList = getPerActionList(actionRGBPath + i, True)
-        imageFLOWList = getPerActionList(actionFLOWPath + i, True)
-        for img_RGB, img_FLow in zip(imageRGBList, imageFLOWList):
+        imageFLOWList = getPerActionList(actionFLOWPath + i, False)
+        for img_RGB, img_FLow in pairPerVideo(imageRGBList, imageFLOWList):
             _img_label = img_RGB + ' ' + img_FLow + ' ' + str(class_num)
             img_label_list.append(_img_label)
         class_num = class_num + 1
@@ -80,7 +106,7 @@ def generate_txt(data_dir_one, data_dir_two, ratio):
     trainFile = './train.txt'
     testFile = './val.txt'
 
-    ACTIONNUM = os.listdir(data_dir_one)
+    ACTIONNUM = sorted(os.listdir(data_dir_one))
 
     img_label = getAllActionList(data_dir_one, data_dir_two, ACTIONNUM)
 
@@ -93,7 +119,30 @@ def generate_txt(data_dir_one, data_dir_two, ratio):
     print('Trainging num: %d' % train_num)
     print('Testing num: %d' % test_num)
 
+def decode_flo8(contents, image_W, image_H):
+    '''decode the bytes of a .flo8 file (optical_flow.save_flow) in the graph
+    Returns:
+        float32 flow in pixels [image_W, image_H, 2], the vectors resized with the frame
+    '''
+    header = tf.decode_raw(tf.substr(contents, 0, 8), tf.int32)
+    scale = tf.decode_raw(tf.substr(contents, 8, 4), tf.float32)[0]
+    flow = tf.decode_raw(contents, tf.int8)[12:]
+    flow = tf.reshape(flow, tf.stack([header[0], header[1], 2]))
+    flow = tf.cast(flow, tf.float32) * scale
+    ratio = tf.stack([float(image_W) / tf.cast(header[0], tf.float32),
+                      float(image_H) / tf.cast(header[1], tf.float32)])
+    flow = tf.image.resize_images(flow, [image_W, image_H], method=0)
+    # dx is along the columns (image_H), dy along the rows (image_W)
+    return flow * tf.reshape(tf.reverse(ratio, [0]), [1, 1, 2])
+
+
 def get_batch(file, image_W, image_H, batch_size, capacity):
+    '''(RGB, Flow, label) batches of a txt list, decoded by the queue runners
+    The flow batch has 2 channels if the flow of the list is stored as int8
+    .flo8 files, else 3, like get_pair_batch.
+    Returns:
+        image_RGB_batch, image_FLOW_batch, label_batch, number of samples
+    '''
 
     img_label = []
     with open(file, 'r') as file_to_read:
@@ -109,6 +158,7 @@ def get_batch(file, image_W, image_H, batch_size, capacity):
         
 
     num = len(img_label)
+    is_flo8 = img_Flow[0].endswith(optical_flow.FLOW_EXT)
     img_RGB = tf.cast(img_RGB, tf.string)
     img_Flow = tf.cast(img_Flow, tf.string)
     label = tf.cast(label, tf.int64)
@@ -120,7 +170,6 @@ def get_batch(file, image_W, image_H, batch_size, capacity):
     image_RGB_contents = tf.read_file(input_queue[0])
     image_FLOW_contents = tf.read_file(input_queue[1])
     image_RGB = tf.image.decode_jpeg(image_RGB_contents, channels=3)
-    image_FLOW = tf.image.decode_jpeg(image_FLOW_contents, channels=3)
     
     ######################################
     # data argumentation should go to here
@@ -128,18 +177,182 @@ def get_batch(file, image_W, image_H, batch_size, capacity):
 
     # image = tf.image.resize_image_with_crop_or_pad(image, image_W, image_H)
     image_RGB = tf.image.resize_images(image_RGB, [image_W, image_H], method=0)
-    image_FLOW = tf.image.resize_images(image_FLOW, [image_W, image_H], method=0)
 
-    image_RGB = tf.image.per_image_standardization(image_RGB)
-    image_FLOW = tf.image.per_image_standardization(image_FLOW)
+    # keep uint8 in the queue, the whole batch is standardized after dequeue
+    image_RGB = tf.saturate_cast(tf.round(image_RGB), tf.uint8)
+    if is_flo8:
+        image_FLOW = decode_flo8(image_FLOW_contents, image_W, image_H)
+    else:
+        image_FLOW = tf.image.decode_jpeg(image_FLOW_contents, channels=3)
+        image_FLOW = tf.image.resize_images(image_FLOW, [image_W, image_H], method=0)
+        image_FLOW = tf.saturate_cast(tf.round(image_FLOW), tf.uint8)
 
-    image_RGB_batch, image_FLOW_batch, label_batch = tf.train.batch([image_RGB, image_FLOW, label],
-                                                                    batch_size=batch_size,
-                                                                    num_threads=64,
-                                                                    capacity=capacity)
+    image_RGB_batch, image_FLOW_batch, label_batch = pipeline_tuner.batch([image_RGB, image_FLOW, label], batch_size, capacity)
     
     label_batch = tf.reshape(label_batch, [batch_size])
-    image_RGB_batch = tf.cast(image_RGB_batch, tf.float32)
-    image_FLOW_batch = tf.cast(image_FLOW_batch, tf.float32)
+    image_RGB_batch = batch_standardization(image_RGB_batch)
+    image_FLOW_batch = batch_standardization(image_FLOW_batch)
     
-    return image_RGB_batch, image_FLOW_batch, label_batch, num
\ No newline at end of file
+    return image_RGB_batch, image_FLOW_batch, label_batch, num
+
+
+#%% Paired RGB + Flow records
+
+def _load_image(image_dir, image_W, image_H):
+    '''read one image, resized to [image_W, image_H, 3] RGB uint8'''
+    image = cv2.imread(image_dir)
+    if image is None:
+        raise IOError('Could not read: %s' % image_dir)
+    # cv2 size is (columns, rows), like resize_images(image, [image_W, image_H])
+    image = cv2.resize(image, (image_H, image_W), interpolation=cv2.INTER_LINEAR)
+    return image[:, :, ::-1]
+
+
+def _load_flow(flow_dir, image_W, image_H):
+    '''read one .flo8 flow, resized to [image_W, image_H, 2] int8 and its scale'''
+    flow, scale = optical_flow.load_flow(flow_dir)
+    height, width = flow.shape[:2]
+    flow = cv2.resize(flow.astype(np.float32), (image_H, image_W), interpolation=cv2.INTER_LINEAR)
+    # the vectors shrink with the frame, so does the scale, the int8 values stay in range
+    ratio_x = float(image_H) / width
+    ratio_y = float(image_W) / height
+    flow[..., 0] *= ratio_x / max(ratio_x, ratio_y)
+    flow[..., 1] *= ratio_y / max(ratio_x, ratio_y)
+    return optical_flow.quantize_flow(flow, 1.0), scale * max(ratio_x, ratio_y)
+
+
+def _load_pair(args):
+    '''read one RGB frame and its flow, both resized to [image_W, image_H]
+    Returns:
+        RGB uint8 bytes, flow bytes (RGB uint8 or int8 dx/dy), flow scale
+    '''
+    rgb_dir, flow_dir, image_W, image_H = args
+    rgb = _load_image(rgb_dir, image_W, image_H)
+    if flow_dir.endswith(optical_flow.FLOW_EXT):
+        flow, scale = _load_flow(flow_dir, image_W, image_H)
+    else:
+        flow, scale = _load_image(flow_dir, image_W, image_H), 1.0
+    return rgb.tobytes(), flow.tobytes(), scale
+
+
+def flow_channels(file):
+    '''2 if the flow of the txt list is stored as .flo8, 3 for flow images'''
+    return 2 if split_txt(file)[1][0].endswith(optical_flow.FLOW_EXT) else 3
+
+
+def pair_record_name(file, image_W, image_H):
+    '''record file of a txt list, e.g. train.txt -> train_120x120_<md5>.tfrecords
+    The name is keyed by the content of the list and the size, a new list or
+    size gives a new name, so records of an older list are never read.
+    '''
+    key = hashlib.md5()
+    with open(file, 'rb') as f:
+        key.update(f.read())
+    key.update(('%dx%d' % (image_W, image_H)).encode('utf-8'))
+    return '%s_%dx%d_%s.tfrecords' % (os.path.splitext(file)[0], image_W, image_H, key.hexdigest())
+
+
+def convert_pairs_to_tfrecord(file, tfrecords_file, image_W, image_H, num_workers=None):
+    '''pack every RGB/Flow pair of a txt list and its label into one tf.train.Example
+    Both images are decoded and resized once here, the reader only parses bytes.
+    Args:
+        file: txt list written by generate_txt, 'rgb flow label' per line
+        tfrecords_file: output file
+        image_W: image width
+        image_H: image height
+        num_workers: number of decode processes, default is the number of cpu cores
+    Returns:
+        number of records
+    '''
+    img_RGB, img_Flow, label = split_txt(file)
+    jobs = [(rgb, flow, image_W, image_H) for rgb, flow in zip(img_RGB, img_Flow)]
+
+    # written to a .tmp file and renamed when complete, a crashed conversion
+    # leaves no file under the final name and is redone on the next call
+    tmp_file = tfrecords_file + '.tmp'
+    writer = tf.python_io.TFRecordWriter(tmp_file)
+    pool = Pool(processes=num_workers or cpu_count())
+    try:
+        # imap keeps the order of the list, so every pair stays with its label
+        for i, (rgb_raw, flow_raw, flow_scale) in enumerate(pool.imap(_load_pair, jobs, chunksize=64)):
+            example = tf.train.Example(features=tf.train.Features(feature={
+                    'label': tf.train.Feature(int64_list=tf.train.Int64List(value=[int(label[i])])),
+                    'rgb_raw': tf.train.Feature(bytes_list=tf.train.BytesList(value=[rgb_raw])),
+                    'flow_raw': tf.train.Feature(bytes_list=tf.train.BytesList(value=[flow_raw])),
+                    'flow_scale': tf.train.Feature(float_list=tf.train.FloatList(value=[flow_scale]))}))
+            writer.write(example.SerializeToString())
+    finally:
+        pool.close()
+        pool.join()
+        writer.close()
+    os.rename(tmp_file, tfrecords_file)
+    print('Write %d pairs to %s' % (len(jobs), tfrecords_file))
+    return len(jobs)
+
+
+def read_pairs(tfrecords_file, image_W, image_H, batch_size, capacity, shuffle=True, flow_channels=3):
+    '''read a record file of convert_pairs_to_tfrecord, generate aligned (RGB, Flow, label) batches
+    Args:
+        tfrecords_file: the record file
+        image_W: image width the records were written with
+        image_H: image height the records were written with
+        batch_size: batch size
+        capacity: number of records to shuffle over
+        shuffle: shuffle the records
+        flow_channels: 3 for flow images, 2 for int8 dx/dy flow
+    Returns:
+        image_RGB_batch: 4D tensor [batch_size, width, height, 3], dtype=tf.float32
+        image_FLOW_batch: 4D tensor [batch_size, width, height, flow_channels], dtype=tf.float32
+        label_batch: 1D tensor [batch_size], dtype=tf.int64
+    '''
+    def parse_batch(serialized_batch):
+        # one parse for the whole batch, both images come out of the same record
+        features = tf.parse_example(serialized_batch,
+                                    features={
+                                           'label': tf.FixedLenFeature([], tf.int64),
+                                           'rgb_raw': tf.FixedLenFeature([], tf.string),
+                                           'flow_raw': tf.FixedLenFeature([], tf.string),
+                                           'flow_scale': tf.FixedLenFeature([], tf.float32),
+                                           })
+        image_RGB = tf.reshape(tf.decode_raw(features['rgb_raw'], tf.uint8), [batch_size, image_W, image_H, 3])
+        if flow_channels == 2:
+            image_FLOW = tf.reshape(tf.decode_raw(features['flow_raw'], tf.int8), [batch_size, image_W, image_H, 2])
+            # back to pixels with the scale of every record
+            image_FLOW = tf.cast(image_FLOW, tf.float32) * tf.reshape(features['flow_scale'], [batch_size, 1, 1, 1])
+        else:
+            image_FLOW = tf.reshape(tf.decode_raw(features['flow_raw'], tf.uint8), [batch_size, image_W, image_H, 3])
+        return image_RGB, image_FLOW, features['label']
+
+    dataset = tf.data.TFRecordDataset(tfrecords_file)
+    if shuffle:
+        dataset = dataset.shuffle(capacity)
+    dataset = dataset.repeat()
+    dataset = dataset.apply(tf.contrib.data.batch_and_drop_remainder(batch_size))
+    dataset = dataset.map(parse_batch, num_parallel_calls=2)
+    dataset = dataset.prefetch(1)
+
+    image_RGB_batch, image_FLOW_batch, label_batch = dataset.make_one_shot_iterator().get_next()
+    image_RGB_batch = batch_standardization(image_RGB_batch)
+    # the 2-channel flow in pixels is standardized like the images, the mean
+    # (camera) motion is removed and the motion of every frame has unit variance
+    image_FLOW_batch = batch_standardization(image_FLOW_batch)
+
+    return image_RGB_batch, image_FLOW_batch, label_batch
+
+
+def get_pair_batch(file, image_W, image_H, batch_size, capacity, shuffle=True):
+    '''same batches as get_batch, read from the paired record file of the txt list
+    The record file is written on the first call. The flow batch has 2 channels
+    if the flow of the list is stored as int8 .flo8 files, else 3.
+    Returns:
+        image_RGB_batch, image_FLOW_batch, label_batch, number of samples
+    '''
+    tfrecords_file = pair_record_name(file, image_W, image_H)
+    if not os.path.exists(tfrecords_file):
+        convert_pairs_to_tfrecord(file, tfrecords_file, image_W, image_H)
+    num = len(split_txt(file)[2])
+
+    image_RGB_batch, image_FLOW_batch, label_batch = read_pairs(tfrecords_file, image_W, image_H,
+                                                                batch_size, capacity, shuffle,
+                                                                flow_channels(file))
+    return image_RGB_batch, image_FLOW_batch, label_batch, num
@@ -11,6 +11,13 @@ import tools
 
 #%%
 def AlexNet(x, y,n_classes, is_pretrain=True):
+    '''two-stream network
+    Args:
+        x: RGB batch, [batch_size, width, height, 3]
+        y: flow batch, [batch_size, width, height, 3] flow images or
+           [batch_size, width, height, 2] dx/dy flow, conv1-flow follows the channels
+        n_classes: number of classes
+    '''
     
     with tf.name_scope('rgb-AlexNet'):
         
@@ -6,12 +6,15 @@ Created on Thu Mar 29 08:03:51 2018
 @author: zhong
 """
 
+import sys
 import os
-import numpy as np
 import tensorflow as tf
 import input_data
+import optical_flow
 import models
 import tools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import train_loop
 
 N_CLASSES = 6
 IMG_W = 120  # resize the image, if the input image is too large, training will be very slow.
@@ -23,7 +26,8 @@ MAX_STEP = 30000  # with current parameters, it is suggested to use MAX_STEP>10k
 LEARNING_RATE = 1e-3  # with current parameters, it is suggested to use learning rate<0.0001
 
 data_dir1 = './data/KTH_RGB/'
-data_dir2 = './data/KTH_Flow/'
+FLOW_STORAGE = 'int8'  # 'int8': 2-channel quantised flow, 'image': 3-channel flow images
+data_dir2 = './data/KTH_Flow/' if FLOW_STORAGE == 'image' else './data/KTH_Flow_int8/'
 model_dir = './model/KTH_twostream/'
 logs_train_dir = './logs/KTH_train/'
 logs_val_dir = './logs/KTH_val/'
@@ -31,6 +35,7 @@ train_txt = 'train.txt'
 val_txt = 'val.txt'
 
 if not os.path.exists(train_txt):
+    optical_flow.compute_flow(data_dir1, data_dir2, storage=FLOW_STORAGE)
     input_data.generate_txt(data_dir1, data_dir2, TRAIN_RATIO)
 
 if not os.path.exists('./model'):
@@ -40,12 +45,12 @@ if not os.path.exists('./model'):
 def train_running():
     with tf.name_scope('input'):
 
-        train_RGB_batch, train_FLOW_batch, train_label_batch, _ = input_data.get_batch(train_txt, IMG_W, IMG_H, BATCH_SIZE, CAPACITY)
-        val_RGB_batch, val_FLOW_batch, val_label_batch, _ = input_data.get_batch(val_txt, IMG_W, IMG_H, BATCH_SIZE, CAPACITY)
+        train_RGB_batch, train_FLOW_batch, train_label_batch, _ = input_data.get_pair_batch(train_txt, IMG_W, IMG_H, BATCH_SIZE, CAPACITY)
+        val_RGB_batch, val_FLOW_batch, val_label_batch, _ = input_data.get_pair_batch(val_txt, IMG_W, IMG_H, BATCH_SIZE, CAPACITY)
     
-    x1 = tf.placeholder(tf.float32, shape=[BATCH_SIZE, IMG_W, IMG_H, 3])
-    x2 = tf.placeholder(tf.float32, shape=[BATCH_SIZE, IMG_W, IMG_H, 3])
-    y_ = tf.placeholder(tf.int32, shape=[BATCH_SIZE])
+    x1 = train_loop.input_placeholder(train_RGB_batch)
+    x2 = train_loop.input_placeholder(train_FLOW_batch)
+    y_ = train_loop.input_placeholder(train_label_batch)
     
     logits = models.AlexNet(x1, x2, N_CLASSES)
     loss = tools.loss(logits, y_)  
@@ -55,46 +60,14 @@ def train_running():
     with tf.Session() as sess:
         saver = tf.train.Saver()
         sess.run(tf.global_variables_initializer())
-        coord = tf.train.Coordinator()
-        threads = tf.train.start_queue_runners(sess= sess, coord=coord)
-        
-        summary_op = tf.summary.merge_all()        
+
+        summary_op = tf.summary.merge_all()
         train_writer = tf.summary.FileWriter(logs_train_dir, sess.graph)
         val_writer = tf.summary.FileWriter(logs_val_dir, sess.graph)
-    
-        try:
-            for step in np.arange(MAX_STEP):
-                if coord.should_stop():
-                        break
-                
-                tra_RGB_images,tra_FLOW_images, tra_labels = sess.run([train_RGB_batch, 
-                                                                       train_FLOW_batch, train_label_batch])
-                _, tra_loss, tra_acc = sess.run([train_op, loss, acc],
-                                                feed_dict={x1:tra_RGB_images, x2:tra_FLOW_images, y_:tra_labels})
-                
-                if step % 50 == 0:
-                    print('Step %d, train loss = %.4f, train accuracy = %.2f%%' %(step, tra_loss, tra_acc))
-                    summary_str = sess.run(summary_op, feed_dict={x1:tra_RGB_images, x2:tra_FLOW_images, y_:tra_labels})
-                    train_writer.add_summary(summary_str, step)
-    #                
-                if step % 200 == 0 or (step + 1) == MAX_STEP:
-                    val_RGB_images, val_FLOW_images, val_labels = sess.run([val_RGB_batch, val_FLOW_batch, val_label_batch])
-                    val_loss, val_acc = sess.run([loss, acc], 
-                                                 feed_dict={x1:val_RGB_images, x2: val_FLOW_images, y_:val_labels})
-                    
-                    print('**  Step %d, val loss = %.4f, val accuracy = %.2f%%  **' %(step, val_loss, val_acc))
-                    summary_str = sess.run(summary_op, feed_dict={x1:val_RGB_images, x2: val_FLOW_images, y_:val_labels})
-                    val_writer.add_summary(summary_str, step)  
-    #                                
-                if step % 2000 == 0 or (step + 1) == MAX_STEP:
-                    checkpoint_path = os.path.join(model_dir, 'model.ckpt')
-                    saver.save(sess, checkpoint_path, global_step=step)
-                    
-        except tf.errors.OutOfRangeError:
-            print('Done training -- epoch limit reached')
-        finally:
-            coord.request_stop()           
-        coord.join(threads)
+
+        train_loop.run_training(sess, train_op, loss, acc, MAX_STEP, model_dir, saver,
+                                val_inputs={x1: val_RGB_batch, x2: val_FLOW_batch, y_: val_label_batch},
+                                summary_op=summary_op, train_writer=train_writer, val_writer=val_writer)
 
 
 if __name__ == '__main__':